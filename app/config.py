@@ -9,6 +9,53 @@ class Settings(BaseSettings):
     APP_NAME: str = "Sunian Photos API"
     DEBUG: bool = True
 
+    # Upload admission control (per process)
+    UPLOAD_RATE_PER_MINUTE: float = 30.0   # sustained uploads per uid/client
+    UPLOAD_BURST: int = 10                 # bucket size, i.e. max back-to-back uploads
+    UPLOAD_MAX_CONCURRENCY: int = 4        # in-flight uploads before shedding with 503
+
+    # Resumable upload staging area
+    UPLOAD_STAGING_DIR: str = "staging"
+    UPLOAD_STAGING_TTL_SECONDS: int = 24 * 3600
+    UPLOAD_STAGING_MAX_BYTES: int = 5 * 1024 ** 3
+    UPLOAD_MAX_CHUNK_BYTES: int = 8 * 1024 ** 2
+    UPLOAD_MAX_FILE_BYTES: int = 500 * 1024 ** 2
+
+    # How long a completed Idempotency-Key result is replayed
+    IDEMPOTENCY_TTL_SECONDS: int = 24 * 3600
+
+    # Background jobs (SQLite, next to the SQLAlchemy tables)
+    JOBS_DB_PATH: str = "media.db"
+    JOB_POLL_SECONDS: float = 1.0
+    JOB_LEASE_SECONDS: int = 600   # a running job older than this is assumed orphaned
+
+    # Live events (SSE): "memory", "sqlite" (shared via JOBS_DB_PATH) or "auto",
+    # which picks sqlite when uvicorn runs more than one worker
+    EVENTS_BROKER: str = "auto"
+    EVENTS_POLL_SECONDS: float = 0.25
+    WEB_CONCURRENCY: int = 1   # read by `uvicorn --workers` as its default too
+
+    # Visual similarity vectors (raw float32 matrix + ".ids" sidecar)
+    FEATURES_PATH: str = "features.f32"
+
+    # Responses smaller than this are sent uncompressed
+    COMPRESS_MIN_BYTES: int = 1024
+
+    # Cloudinary
+    CLOUDINARY_CLOUD_NAME: str
+    CLOUDINARY_API_KEY: str
+    CLOUDINARY_API_SECRET: str
+    # direct uploads must be finalized within this window (matches Cloudinary's signed-timestamp expiry)
+    DIRECT_UPLOAD_MAX_AGE_SECONDS: int = 3600
+
+    # CORS
+    CORS_ORIGINS: str = "http://localhost:8000,http://localhost:8000/photos,http://localhost:5173,https://sunianphotosfrontend.vercel.app/"
+
+    class Config:
+        env_file = ".env"
+        env_file_encoding = "utf-8"
+        populate_by_name = True   # ✅ allow alias mapping
+
     # Firebase (map env var name → field name)
     
 
@@ -32,17 +79,4 @@ if firebase_credentials_json:
     else:
         print("GOOGLE_APPLICATION_CREDENTIALS environment variable not found.")
 
-    # Cloudinary
-    CLOUDINARY_CLOUD_NAME: str
-    CLOUDINARY_API_KEY: str
-    CLOUDINARY_API_SECRET: str
-
-    # CORS
-    CORS_ORIGINS: str = "http://localhost:8000,http://localhost:8000/photos,http://localhost:5173,https://sunianphotosfrontend.vercel.app/"
-
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
-        populate_by_name = True   # ✅ allow alias mapping
-
 settings = Settings()
@@ -2,16 +2,28 @@ import os
 import uuid
 import datetime
 from typing import List, Optional
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Path, Body, Depends, status
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, Path, Body, Depends, Query, Request, status
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import cloudinary
 from cloudinary.uploader import upload as cloudinary_upload
 from app.config import settings
 from app.schemas import ImageCreateResp
+from app.utils.ratelimit import UploadAdmissionMiddleware, run_upload_io
+from app.utils.current_user import CurrentUser
+from starlette.datastructures import Headers
+from app.utils.responses import FirestoreJSONResponse, dumps
+from app.utils.compression import CompressionMiddleware
+from app.utils.idempotency import IdempotencyStore, sha256_file
+from app.utils.exif import compact_exif, extract_exif, normalize_camera_model
+from app.utils.geo import location_fields
+from app.utils import events
+from app.utils.jobs import jobs
 import firebase_admin
 from firebase_admin import credentials, firestore, auth
 from pydantic import BaseModel
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from google.api_core.exceptions import NotFound
 from fastapi import Response # Add this import at the top
 # -------------------------
 # Configure Cloudinary
@@ -35,7 +47,7 @@ cloudinary.config(
 # -------------------------
 try:
     print("Creating FastAPI app")
-    app = FastAPI(title=settings.APP_NAME)
+    app = FastAPI(title=settings.APP_NAME, default_response_class=FirestoreJSONResponse)
     if not firebase_admin._apps:
         cred = credentials.Certificate(settings.credentials_data)
     firebase_admin.initialize_app(cred)
@@ -43,6 +55,42 @@ try:
 except Exception as e:
     print(f"App failed to start: {e}")
     raise
+idempotency = IdempotencyStore(db)
+
+
+@app.on_event("startup")
+async def start_job_workers():
+    await jobs.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await jobs.stop()
+
+def upload_admission_key(scope) -> str:
+    """Rate-limit bucket for an upload request: the caller's uid, else client address."""
+    authorization = Headers(scope=scope).get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        try:
+            return f"uid:{auth.verify_id_token(authorization[7:])['uid']}"
+        except Exception:
+            pass  # the route itself rejects bad tokens; throttle by address meanwhile
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+# throttled before the multipart body is read (see UploadAdmissionMiddleware);
+# resumable chunks (PATCH /api/uploads/{id}) are not, only create and complete
+UPLOAD_PATHS = [
+    r"/api/upload",
+    r"/api/images/photos",
+    r"/api/images/photos/sign",
+    r"/api/uploads/?",
+    r"/api/uploads/[0-9a-f]+/complete",
+]
+# added before CORS so throttled responses still get CORS headers
+app.add_middleware(UploadAdmissionMiddleware, paths=UPLOAD_PATHS, key_func=upload_admission_key)
+
 # CORS
 origins = [o.strip() for o in settings.CORS_ORIGINS.split(",") if o.strip()]
 app.add_middleware(
@@ -52,10 +100,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESS_MIN_BYTES)
 
 bearer_scheme = HTTPBearer()
 
-async def get_current_user_role(token: HTTPAuthorizationCredentials = Depends(bearer_scheme)):
+async def get_current_user(token: HTTPAuthorizationCredentials = Depends(bearer_scheme)) -> CurrentUser:
     try:
         print("Received Authorization Header:", token.credentials)
         decoded_token = auth.verify_id_token(token.credentials)
@@ -67,12 +116,12 @@ async def get_current_user_role(token: HTTPAuthorizationCredentials = Depends(be
         user_doc = user_doc_ref.get()
         if not user_doc.exists:
             print("User document not found, returning 'visitor'")
-            return "visitor"
+            return CurrentUser(uid=uid, email=decoded_token.get('email'), role="visitor")
         
         user_data = user_doc.to_dict()
         user_role = user_data.get('role', 'visitor')
         print("User Role from Firestore:", user_role)
-        return user_role
+        return CurrentUser(uid=uid, email=decoded_token.get('email'), role=user_role)
 
     except Exception as e:
         print("Authentication Failed:", e)
@@ -81,6 +130,11 @@ async def get_current_user_role(token: HTTPAuthorizationCredentials = Depends(be
             detail=f"Invalid authentication credentials: {e}",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+async def get_current_user_role(user: CurrentUser = Depends(get_current_user)):
+    return user.role
+
+
 # -------------------------
 # Health Check
 # -------------------------
@@ -96,46 +150,75 @@ def health():
 async def upload_image(
     file: UploadFile = File(...),
     album: str = Form(None),
-    user_role: str = Depends(get_current_user_role)
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    user: CurrentUser = Depends(get_current_user)
 ):
-    if user_role not in ["admin", "editor"]:
+    if user.role not in ["admin", "editor"]:
         raise HTTPException(
             status_code=403,
             detail="You do not have permission to upload images."
         )
+    folder = album or "default"
+    digest = await run_upload_io(sha256_file, file.file)
+    exif = await run_upload_io(extract_exif, file.file)
+    file.file.seek(0)
+    # the same user uploading the same bytes always maps to the same document/asset
+    image_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"sunian-photos:{user.uid}:{digest}"))
+    scope = f"uid:{user.uid}"
+    if idempotency_key:
+        cached = idempotency.begin(scope, idempotency_key, digest)
+        if cached is not None:
+            return cached
     try:
-        # Upload to Cloudinary
-        result = cloudinary_upload(
-            file.file,
-            folder=album or "default",
-            resource_type="image",
-            overwrite=True,
-        )
-
-        if not result:
-            raise HTTPException(status_code=500, detail="Upload failed")
-
-        # Prepare image data
-        image_id = str(uuid.uuid4())
-        image_data = {
-            "id": image_id,
-            "filename": file.filename,
-            "url": result.get("secure_url"),
-            "mime_type": result.get("resource_type"),
-            "width": result.get("width"),
-            "height": result.get("height"),
-            "size_bytes": result.get("bytes"),
-            "title": None,
-            "caption": None,
-            "alt_text": None,
-            "uploaded_at": datetime.datetime.utcnow().isoformat(),
-            "order": int(datetime.datetime.utcnow().timestamp()),  # default order by time
-        }
-
-        # Save to Firestore
-        db.collection("images").document(image_id).set(image_data)
-
-        return ImageCreateResp(
+        doc = db.collection("images").document(image_id).get()
+        if doc.exists:
+            image_data = doc.to_dict()
+        else:
+            # Upload to Cloudinary
+            result = await run_upload_io(
+                cloudinary_upload,
+                file.file,
+                folder=folder,
+                public_id=image_id,
+                resource_type="image",
+                overwrite=True,
+            )
+
+            if not result:
+                raise HTTPException(status_code=500, detail="Upload failed")
+
+            # Prepare image data
+            uploaded_at = datetime.datetime.utcnow()
+            exif_compact = compact_exif(exif)
+            image_data = {
+                "id": image_id,
+                "public_id": result.get("public_id"),  # "<folder>/<id>" on Cloudinary
+                "filename": file.filename,
+                "url": result.get("secure_url"),
+                "mime_type": result.get("resource_type"),
+                "width": result.get("width"),
+                "height": result.get("height"),
+                "size_bytes": result.get("bytes"),
+                "title": None,
+                "caption": None,
+                "alt_text": None,
+                "uploaded_at": uploaded_at,  # native timestamp so range queries work
+                "updated_at": uploaded_at,  # bumped on every write; drives incremental export
+                "exif": exif_compact,
+                "camera_model": normalize_camera_model(exif),
+                # geo search only sees documents with privacy == "public"
+                "privacy": "public",
+                **location_fields(exif_compact),
+                "sha256": digest,
+                "order": int(uploaded_at.timestamp()),  # default order by time
+            }
+
+            # Save to Firestore
+            db.collection("images").document(image_id).set(image_data)
+            record_facet_change(None, image_data)
+            jobs.enqueue("index_image_features", {"image_id": image_id, "public_id": image_data["public_id"]})
+
+        response = ImageCreateResp(
             id=image_data["id"],
             filename=image_data["filename"],
             storage_path=image_data["url"],
@@ -146,9 +229,14 @@ async def upload_image(
             title=image_data["title"],
             caption=image_data["caption"],
             alt_text=image_data["alt_text"],
-            uploaded_at=datetime.datetime.fromisoformat(image_data["uploaded_at"]),
+            uploaded_at=image_data["uploaded_at"],
         )
+        if idempotency_key:
+            idempotency.finish(scope, idempotency_key, response.model_dump(mode="json"))
+        return response
     except Exception as e:
+        if idempotency_key:
+            idempotency.abandon(scope, idempotency_key)
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
@@ -160,36 +248,104 @@ def list_images():
     try:
         docs = db.collection("images").order_by("order").stream()
         images = [doc.to_dict() for doc in docs]
-        return {"images": images}
+        for rec in images:
+            rec.pop("exif", None)
+        return FirestoreJSONResponse({"images": images})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch images: {str(e)}")
 
 
 # -------------------------
-# Delete Image
+# Export Images (NDJSON stream)
 # -------------------------
+EXPORT_PAGE_SIZE = 300
 
 
-@app.delete("/api/images/{image_id}", status_code=204)
-def delete_image(image_id: str = Path(..., description="ID of the image to delete"),user_role: str = Depends(get_current_user_role)):
-    if user_role not in ["admin", "editor"]:
+def iter_image_export(since=None, album_id=None, privacy=None, uploaded_by=None, include_comments=True):
+    """
+    Yield one JSON line per image, reading Firestore a page at a time so
+    memory stays flat no matter how large the collection is.
+
+    `since` filters on `updated_at`, which upload, edit, like, comment,
+    album and reorder writes all bump, so incremental exports pick up
+    changes to older images too. Composite indexes needed with `since`:
+    (album_id|privacy|uploaded_by, updated_at, __name__).
+    """
+    query = db.collection("images")
+    if album_id:
+        query = query.where(filter=firestore.FieldFilter("album_id", "==", album_id))
+    if privacy:
+        query = query.where(filter=firestore.FieldFilter("privacy", "==", privacy))
+    if uploaded_by:
+        query = query.where(filter=firestore.FieldFilter("uploaded_by", "==", uploaded_by))
+    if since:
+        query = query.where(filter=firestore.FieldFilter("updated_at", ">=", since))
+        query = query.order_by("updated_at")
+    # a full export orders by id alone so documents without updated_at aren't skipped
+    query = query.order_by("__name__").limit(EXPORT_PAGE_SIZE)
+
+    last = None
+    while True:
+        page = query.start_after(last) if last is not None else query
+        docs = list(page.stream())
+        for doc in docs:
+            rec = doc.to_dict()
+            rec.setdefault("id", doc.id)
+            if include_comments:
+                comments = doc.reference.collection("comments").order_by("created_at").stream()
+                rec["comments"] = [c.to_dict() for c in comments]
+            yield dumps(rec) + b"\n"
+        if len(docs) < EXPORT_PAGE_SIZE:
+            break
+        last = docs[-1]
+
+
+@app.get("/api/images/export")
+def export_images(
+    since: Optional[datetime.datetime] = Query(None, description="Only images created or changed at or after this time"),
+    album_id: Optional[str] = Query(None),
+    privacy: Optional[str] = Query(None),
+    uploaded_by: Optional[str] = Query(None),
+    include_comments: bool = Query(True),
+    user_role: str = Depends(get_current_user_role),
+):
+    if user_role != "admin":
         raise HTTPException(
             status_code=403,
-            detail="You do not have permission to delete images."
+            detail="You do not have permission to export images."
         )
-    try:
-        doc_ref = db.collection("images").document(image_id)
-        doc = doc_ref.get()
-        if not doc.exists:
-            raise HTTPException(status_code=404, detail="Image not found")
+    stream = iter_image_export(
+        since=since,
+        album_id=album_id,
+        privacy=privacy,
+        uploaded_by=uploaded_by,
+        include_comments=include_comments,
+    )
+    return StreamingResponse(
+        stream,
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="images.ndjson"'},
+    )
+
+
+# -------------------------
+# Delete Image
+# -------------------------
+# DELETE /api/images/{image_id} is served by app.routes.images.delete_image,
+# which also updates facets and the similarity index and destroys the asset.
+@jobs.handler("purge_image_comments", concurrency=2)
+def purge_image_comments(payload: dict):
+    comments = db.collection("images").document(payload["image_id"]).collection("comments")
+    while True:
+        docs = list(comments.limit(300).stream())
+        if not docs:
+            break
+        batch = db.batch()
+        for doc in docs:
+            batch.delete(doc.reference)
+        batch.commit()
+
 
-        doc_ref.delete()
-        
-        # Return a 204 status code with no content
-        return Response(status_code=status.HTTP_204_NO_CONTENT)
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to delete image: {str(e)}")
 # -------------------------
 # Reorder Images
 # -------------------------
@@ -207,7 +363,7 @@ def reorder_images(
         batch = db.batch()
         for index, image_id in enumerate(order):
             doc_ref = db.collection("images").document(image_id)
-            batch.update(doc_ref, {"order": index})
+            batch.update(doc_ref, {"order": index, "updated_at": datetime.datetime.utcnow()})
         batch.commit()
         return {"status": "ok", "order": order}
     except Exception as e:
@@ -220,9 +376,11 @@ def reorder_images(
 @app.post("/api/images/photos", response_model=ImageCreateResp)
 async def upload_image_compat(
     file: UploadFile = File(...),
-    album: str = Form(None)
+    album: str = Form(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    user: CurrentUser = Depends(get_current_user),
 ):
-    return await upload_image(file=file, album=album)
+    return await upload_image(file=file, album=album, idempotency_key=idempotency_key, user=user)
 
 
 
@@ -278,15 +436,16 @@ def toggle_like(image_id: str, payload: dict = Body(...)):
 
         # If user already in likes -> remove, else add
         if identifier in likes:
-            doc_ref.update({"likes": firestore.ArrayRemove([identifier])})
+            doc_ref.update({"likes": firestore.ArrayRemove([identifier]), "updated_at": datetime.datetime.utcnow()})
             liked = False
         else:
-            doc_ref.update({"likes": firestore.ArrayUnion([identifier])})
+            doc_ref.update({"likes": firestore.ArrayUnion([identifier]), "updated_at": datetime.datetime.utcnow()})
             liked = True
 
         # fetch final state to return accurate total (atomic ops already applied)
         final_doc = doc_ref.get()
         final_likes = final_doc.to_dict().get("likes", []) or []
+        events.publish(image_id, {"type": "likes", "total_likes": len(final_likes)})
         return {"liked": liked, "total_likes": len(final_likes)}
     except HTTPException:
         raise
@@ -315,6 +474,12 @@ def add_comment(image_id: str, comment: CommentCreate):
         }
         # store in subcollection "comments"
         db.collection("images").document(image_id).collection("comments").add(comment_data)
+        try:
+            # new comments count as a change to the image for incremental exports
+            db.collection("images").document(image_id).update({"updated_at": datetime.datetime.utcnow()})
+        except NotFound:
+            pass
+        events.publish(image_id, {"type": "comment", "comment": comment_data})
         return comment_data
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to add comment: {str(e)}")
@@ -333,3 +498,73 @@ def list_comments(image_id: str):
         return [doc.to_dict() for doc in docs]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch comments: {str(e)}")
+
+# ------------------------- Live like/comment events (SSE) -------------------------
+SSE_HEARTBEAT_SECONDS = 15
+SSE_MAX_IMAGES = 200
+
+@app.get("/api/images/events")
+async def image_events(request: Request, ids: str = Query(..., description="Comma-separated image IDs to watch")):
+    """
+    Server-sent events for the given images: `likes` (latest total_likes),
+    `comment` (the new comment) and `resync` (client fell behind; refetch).
+    """
+    image_ids = [i for i in (x.strip() for x in ids.split(",")) if i]
+    if not image_ids or len(image_ids) > SSE_MAX_IMAGES:
+        raise HTTPException(status_code=400, detail=f"Provide between 1 and {SSE_MAX_IMAGES} image IDs")
+
+    async def stream():
+        sub = events.subscribe(image_ids)
+        try:
+            yield b"retry: 3000\n\n"
+            while not await request.is_disconnected():
+                event = await sub.get(timeout=SSE_HEARTBEAT_SECONDS)
+                if event is None:
+                    yield b": ping\n\n"
+                    continue
+                yield b"event: " + event["type"].encode() + b"\ndata: " + dumps(event) + b"\n\n"
+        finally:
+            events.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ------------------------- Background jobs (inspection) -------------------------
+@app.get("/api/jobs")
+def list_jobs(
+    status: Optional[str] = Query(None, description="queued, running, done or failed"),
+    job_type: Optional[str] = Query(None, alias="type"),
+    limit: int = Query(50, ge=1, le=500),
+    user_role: str = Depends(get_current_user_role),
+):
+    if user_role != "admin":
+        raise HTTPException(status_code=403, detail="Admin privileges required")
+    return {"stats": jobs.stats(), "jobs": jobs.list(status=status, job_type=job_type, limit=limit)}
+
+
+@app.post("/api/jobs/{job_id}/retry")
+def retry_job(job_id: int, user_role: str = Depends(get_current_user_role)):
+    if user_role != "admin":
+        raise HTTPException(status_code=403, detail="Admin privileges required")
+    if not jobs.retry(job_id):
+        raise HTTPException(status_code=404, detail="No failed job with that ID")
+    return {"ok": True, "id": job_id}
+
+
+# ------------------------- Routers -------------------------
+# imported here, after Firebase is initialised above, since app.utils.firebase_auth
+# reuses the default app. No path may be served both above and by a router
+# (tests/test_routes.py checks that nothing is shadowed).
+from app.routes import albums, comments, images, search, uploads, users  # noqa: E402
+from app.utils.facets import record_facet_change  # noqa: E402
+
+app.include_router(images.router, prefix="/api/images", tags=["images"])
+app.include_router(uploads.router, prefix="/api/uploads", tags=["uploads"])
+app.include_router(search.router, prefix="/api/search", tags=["search"])
+app.include_router(albums.router, prefix="/api/albums", tags=["albums"])
+app.include_router(comments.router, prefix="/api/comments", tags=["comments"])
+app.include_router(users.router, prefix="/api/users", tags=["users"])
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
 from datetime import datetime
+from google.cloud import firestore
 from app.utils.firebase_auth import verify_firebase_token, CurrentUser, db
 from app.schemas import AlbumCreate
+from app.utils.facets import record_facet_change
 
 router = APIRouter()
 
@@ -33,13 +35,18 @@ def get_album(album_id: str):
     return doc.to_dict()
 
 @router.post("/{album_id}/add")
-def add_image_to_album(album_id: str, public_id: str, user: CurrentUser = Depends(verify_firebase_token)):
+def add_image_to_album(album_id: str, image_id: str, user: CurrentUser = Depends(verify_firebase_token)):
     # only owner/editor/admin can add
     album_ref = db.collection("albums").document(album_id)
     album = album_ref.get()
     if not album.exists:
         raise HTTPException(status_code=404, detail="Album not found")
-    album_ref.update({"image_ids": firestore.ArrayUnion([public_id])})
+    album_ref.update({"image_ids": firestore.ArrayUnion([image_id])})
     # also update image doc album_id
-    db.collection("images").document(public_id).set({"album_id": album_id}, merge=True)
+    image_ref = db.collection("images").document(image_id)
+    image = image_ref.get()
+    image_ref.set({"album_id": album_id, "updated_at": datetime.utcnow()}, merge=True)
+    if image.exists:
+        rec = image.to_dict()
+        record_facet_change(rec, {**rec, "album_id": album_id})
     return {"ok": True}
@@ -1,41 +1,45 @@
 from fastapi import APIRouter, Depends, HTTPException
 from datetime import datetime
+from google.cloud import firestore
 from app.utils.firebase_auth import verify_firebase_token, CurrentUser, db
 from app.schemas import CommentCreate
+from app.utils import events
 
 router = APIRouter()
 
-@router.post("/{public_id}")
-def add_comment(public_id: str, payload: CommentCreate, user: CurrentUser = Depends(verify_firebase_token)):
+@router.post("/{image_id}")
+def add_comment(image_id: str, payload: CommentCreate, user: CurrentUser = Depends(verify_firebase_token)):
     # ensure image exists
-    img = db.collection("images").document(public_id).get()
+    img = db.collection("images").document(image_id).get()
     if not img.exists:
         raise HTTPException(status_code=404, detail="Image not found")
-    col = db.collection("images").document(public_id).collection("comments")
+    col = db.collection("images").document(image_id).collection("comments")
     doc_ref = col.document()
     data = {
         "id": doc_ref.id,
-        "image_id": public_id,
+        "image_id": image_id,
         "author_uid": user.uid,
         "content": payload.content,
         "created_at": datetime.utcnow()
     }
     doc_ref.set(data)
+    db.collection("images").document(image_id).update({"updated_at": data["created_at"]})
+    events.publish(image_id, {"type": "comment", "comment": data})
     return data
 
-@router.get("/{public_id}")
-def list_comments(public_id: str):
-    img = db.collection("images").document(public_id).get()
+@router.get("/{image_id}")
+def list_comments(image_id: str):
+    img = db.collection("images").document(image_id).get()
     if not img.exists:
         raise HTTPException(status_code=404, detail="Image not found")
-    col = db.collection("images").document(public_id).collection("comments")
+    col = db.collection("images").document(image_id).collection("comments")
     snapshot = col.order_by("created_at", direction=firestore.Query.DESCENDING).stream()
     out = [d.to_dict() for d in snapshot]
     return {"comments": out}
 
-@router.delete("/{public_id}/{comment_id}")
-def delete_comment(public_id: str, comment_id: str, user: CurrentUser = Depends(verify_firebase_token)):
-    comment_ref = db.collection("images").document(public_id).collection("comments").document(comment_id)
+@router.delete("/{image_id}/{comment_id}")
+def delete_comment(image_id: str, comment_id: str, user: CurrentUser = Depends(verify_firebase_token)):
+    comment_ref = db.collection("images").document(image_id).collection("comments").document(comment_id)
     doc = comment_ref.get()
     if not doc.exists:
         raise HTTPException(status_code=404, detail="Comment not found")
@@ -44,4 +48,5 @@ def delete_comment(public_id: str, comment_id: str, user: CurrentUser = Depends(
     if user.uid != rec.get("author_uid") and user.role not in ("editor", "admin"):
         raise HTTPException(status_code=403, detail="Permission denied")
     comment_ref.delete()
+    db.collection("images").document(image_id).update({"updated_at": datetime.utcnow()})
     return {"ok": True}
@@ -1,15 +1,28 @@
-from fastapi import APIRouter, File, UploadFile, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import List, Optional
 import cloudinary
 import cloudinary.uploader
 import cloudinary.api
+import cloudinary.utils
+import cloudinary.exceptions
+import time
+import uuid
 from app.config import settings
 from app.utils.firebase_auth import verify_firebase_token, CurrentUser, db
-from app.schemas import ImageEdit   # ✅ add this
+from app.schemas import ImageEdit, DirectUploadFinalize   # ✅ add this
+from app.utils.facets import record_facet_change
+from app.utils.geo import location_fields
+from app.utils.jobs import jobs
+from app.utils.features import cloudinary_public_id, feature_index, fetch_features
+from app.utils.responses import FirestoreJSONResponse
 from google.cloud import firestore  # ✅ fix for query ordering
 from datetime import datetime, timezone
-from PIL import Image, ExifTags
-from io import BytesIO
+from app.utils.exif import (
+    compact_exif,
+    extract_exif,
+    normalize_camera_model,
+    without_exif,
+)
 
 router = APIRouter()
 
@@ -21,86 +34,154 @@ cloudinary.config(
     secure=True
 )
 
-def extract_exif_bytes(b: bytes):
-    try:
-        img = Image.open(BytesIO(b))
-        raw = getattr(img, "_getexif", lambda: {})() or {}
-        exif = {}
-        for k, v in raw.items():
-            name = ExifTags.TAGS.get(k, k)
-            exif[name] = v
-        return exif
-    except Exception:
-        return {}
-
-@router.post("/photos")
-async def upload_image(
-    file: UploadFile = File(...), 
-    title: Optional[str] = None, 
-    album_id: Optional[str] = None, 
-    privacy: str = "public", 
-    user: CurrentUser = Depends(verify_firebase_token)
-):
+def find_duplicate(uid: str, sha256: str) -> Optional[dict]:
+    """An existing image by this user with identical bytes, if any."""
+    docs = (
+        db.collection("images")
+        .where(filter=firestore.FieldFilter("uploaded_by", "==", uid))
+        .where(filter=firestore.FieldFilter("sha256", "==", sha256))
+        .limit(1)
+        .stream()
+    )
+    for doc in docs:
+        return doc.to_dict()
+    return None
+
+def upload_folder(uid: str) -> str:
+    return f"sunian-photos/{uid}"
+
+def image_doc_id(public_id: str) -> str:
     """
-    Uploads the image to Cloudinary and stores metadata in Firestore.
+    Firestore doc id for a Cloudinary asset. public_ids contain "/", which
+    Firestore would read as a subcollection path, so derive a flat id.
     """
-    # Initialize public_id outside the try block to ensure it's always defined
-    public_id = None
-    
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"cloudinary:{public_id}"))
+
+def save_image_metadata(
+    result: dict,
+    *,
+    filename: Optional[str],
+    mime_type: Optional[str],
+    exif: dict,
+    user: CurrentUser,
+    title: Optional[str] = None,
+    album_id: Optional[str] = None,
+    privacy: str = "public",
+    sha256: Optional[str] = None,
+) -> dict:
+    """
+    Write the Firestore 'images' document for a finished Cloudinary upload.
+    Shared by every upload path so the stored shape stays identical.
+    """
+    public_id = result.get("public_id")
+    image_id = image_doc_id(public_id)
+    exif_compact = compact_exif(exif)
+    now = datetime.utcnow()
+    # store metadata in Firestore collection 'images'; public_id is a field
+    data = {
+        "id": image_id,
+        "public_id": public_id,
+        "url": result.get("secure_url"),
+        "filename": filename,
+        "mime_type": mime_type,
+        "width": result.get("width"),
+        "height": result.get("height"),
+        "size_bytes": result.get("bytes"),
+        "title": title or "",
+        "caption": "",
+        "alt_text": "",
+        "license": "",
+        "privacy": privacy,
+        "uploaded_by": user.uid,
+        "uploaded_at": now,
+        "updated_at": now,
+        "exif": exif_compact,
+        "camera_model": normalize_camera_model(exif),
+        **location_fields(exif_compact),
+        "album_id": album_id or None,
+        "tags": [],
+        "sha256": sha256,
+    }
+    db.collection("images").document(image_id).set(data)
+    record_facet_change(None, data)
+    jobs.enqueue("index_image_features", {"image_id": image_id, "public_id": public_id})
+    return data
+
+@router.post("/photos/sign")
+def sign_direct_upload(user: CurrentUser = Depends(verify_firebase_token)):
+    """
+    Phase 1 of a direct upload: signed parameters that let the browser post
+    the file straight to Cloudinary, confined to the caller's folder.
+    """
+    params = {
+        "timestamp": int(time.time()),
+        "folder": upload_folder(user.uid),
+        # booleans signed as 1, matching what the Cloudinary SDK sends
+        "use_filename": 1,
+        "unique_filename": 1,
+        "image_metadata": 1,
+    }
+    signature = cloudinary.utils.api_sign_request(params, settings.CLOUDINARY_API_SECRET)
+    return {
+        **params,
+        "signature": signature,
+        "api_key": settings.CLOUDINARY_API_KEY,
+        "upload_url": cloudinary.utils.cloudinary_api_url("upload", resource_type="image"),
+    }
+
+def _cloudinary_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+@router.post("/photos/finalize")
+def finalize_direct_upload(payload: DirectUploadFinalize, user: CurrentUser = Depends(verify_firebase_token)):
+    """
+    Phase 2: verify the signature Cloudinary returned with the upload and
+    write the same Firestore document as upload_image. Everything except
+    title/album/privacy is read back from Cloudinary, never from the client.
+    """
+    if not cloudinary.utils.verify_api_response_signature(
+        payload.public_id, payload.version, payload.signature
+    ):
+        raise HTTPException(status_code=400, detail="Invalid Cloudinary signature")
+    if not payload.public_id.startswith(upload_folder(user.uid) + "/"):
+        raise HTTPException(status_code=403, detail="Upload does not belong to this user")
+
+    doc = db.collection("images").document(image_doc_id(payload.public_id)).get()
+    if doc.exists:
+        # finalize retried after success
+        rec = doc.to_dict()
+        return {"ok": True, "id": doc.id, "public_id": payload.public_id, "url": rec.get("url")}
+
     try:
-        contents = await file.read()
-        
-        # extract exif locally (optional)
-        exif = extract_exif_bytes(contents)
-        
-        # upload to cloudinary under folder per user
-        folder = f"sunian-photos/{user.uid}"
-        
-        result = cloudinary.uploader.upload(
-            BytesIO(contents),
-            folder=folder,
-            resource_type="image",
-            use_filename=True,
-            unique_filename=True
-        )
-        
-        public_id = result.get("public_id")
-        url = result.get("secure_url")
-        width = result.get("width")
-        height = result.get("height")
-        format_ = result.get("format")
-        bytes_len = result.get("bytes")
-        
-        # store metadata in Firestore collection 'images', doc id = public_id
-        data = {
-            "public_id": public_id,
-            "url": url,
-            "filename": file.filename,
-            "mime_type": file.content_type,
-            "width": width,
-            "height": height,
-            "size_bytes": bytes_len,
-            "title": title or "",
-            "caption": "",
-            "alt_text": "",
-            "license": "",
-            "privacy": privacy,
-            "uploaded_by": user.uid,
-            "uploaded_at": datetime.utcnow(),
-            "exif": exif,
-            "album_id": album_id or None,
-            "tags": [],
-        }
-        
-        db.collection("images").document(public_id).set(data)
-        return {"ok": True, "public_id": public_id, "url": url}
+        resource = cloudinary.api.resource(payload.public_id, image_metadata=True)
+    except cloudinary.exceptions.NotFound:
+        # deleted images have their asset destroyed, so replays end here
+        raise HTTPException(status_code=404, detail="Upload not found on Cloudinary")
+    if int(resource.get("version") or 0) != payload.version:
+        raise HTTPException(status_code=409, detail="Upload was replaced; finalize the current version")
+    created_at = _cloudinary_time(resource.get("created_at"))
+    max_age = settings.DIRECT_UPLOAD_MAX_AGE_SECONDS
+    if created_at is None or (datetime.now(timezone.utc) - created_at).total_seconds() > max_age:
+        raise HTTPException(status_code=410, detail="Upload is too old to finalize")
 
-    except Exception as e:
-        # Now, `public_id` is defined and can be returned in the error message
-        raise HTTPException(
-            status_code=500, 
-            detail=f"An error occurred during upload. Public ID: {public_id}. Error: {e}"
-        )
+    fmt = resource.get("format")
+    filename = payload.public_id.rsplit("/", 1)[-1]
+    if fmt:
+        filename = f"{filename}.{fmt}"
+    data = save_image_metadata(
+        resource,
+        filename=filename,
+        mime_type=f"image/{fmt}" if fmt else None,
+        # Cloudinary's image_metadata uses EXIF tag names with string values
+        exif=resource.get("image_metadata") or {},
+        user=user,
+        title=payload.title,
+        album_id=payload.album_id,
+        privacy=payload.privacy,
+    )
+    return {"ok": True, "id": data["id"], "public_id": payload.public_id, "url": data["url"]}
 
 @router.get("/")
 def list_images(q: Optional[str] = Query(None), album_id: Optional[str] = Query(None), limit: int = 50, skip: int = 0, uid: Optional[str] = None):
@@ -113,7 +194,7 @@ def list_images(q: Optional[str] = Query(None), album_id: Optional[str] = Query(
 
     results = []
     for doc in snapshot:
-        rec = doc.to_dict()
+        rec = without_exif(doc.to_dict())  # EXIF is only served by get_image
         results.append(rec)
     
     print(f"Fetched {len(results)} documents before filtering.")
@@ -151,12 +232,13 @@ def list_images(q: Optional[str] = Query(None), album_id: Optional[str] = Query(
     
     print(f"Returning {len(final_results)} images after filtering.")
     
-    return {"count": len(final_results), "images": final_results}
+    # return the response directly: FastAPI's jsonable_encoder pass is slow and can't encode bytes
+    return FirestoreJSONResponse({"count": len(final_results), "images": final_results})
 
 
-@router.get("/{public_id}")
-def get_image(public_id: str, user: CurrentUser = Depends(verify_firebase_token)):
-    doc = db.collection("images").document(public_id).get()
+@router.get("/{image_id}")
+def get_image(image_id: str, user: CurrentUser = Depends(verify_firebase_token)):
+    doc = db.collection("images").document(image_id).get()
     if not doc.exists:
         raise HTTPException(status_code=404, detail="Not found")
     rec = doc.to_dict()
@@ -164,11 +246,12 @@ def get_image(public_id: str, user: CurrentUser = Depends(verify_firebase_token)
     privacy = rec.get("privacy", "public")
     if privacy == "private" and user.role not in ("admin", "editor") and user.uid != rec.get("uploaded_by"):
         raise HTTPException(status_code=403, detail="Access denied")
-    return rec
+    # legacy docs may still hold raw EXIF bytes; firestore_default base64-encodes them
+    return FirestoreJSONResponse(rec)
 
-@router.post("/{public_id}/edit")
-def edit_image(public_id: str, payload: ImageEdit, user: CurrentUser = Depends(verify_firebase_token)):
-    doc_ref = db.collection("images").document(public_id)
+@router.post("/{image_id}/edit")
+def edit_image(image_id: str, payload: ImageEdit, user: CurrentUser = Depends(verify_firebase_token)):
+    doc_ref = db.collection("images").document(image_id)
     doc = doc_ref.get()
     if not doc.exists:
         raise HTTPException(status_code=404, detail="Not found")
@@ -181,12 +264,25 @@ def edit_image(public_id: str, payload: ImageEdit, user: CurrentUser = Depends(v
     to_update = {k: v for k, v in updates.items() if k in allowed}
 
     if to_update:
-        doc_ref.set(to_update, merge=True)
+        doc_ref.set({**to_update, "updated_at": datetime.utcnow()}, merge=True)
+        record_facet_change(rec, {**rec, **to_update})
     return {"ok": True, "updated": to_update}
 
-@router.delete("/{public_id}")
-def delete_image(public_id: str, user: CurrentUser = Depends(verify_firebase_token)):
-    doc_ref = db.collection("images").document(public_id)
+@jobs.handler("destroy_cloudinary_asset", concurrency=2)
+def destroy_cloudinary_asset(payload: dict):
+    result = cloudinary.uploader.destroy(payload["public_id"], invalidate=True, resource_type="image")
+    if result.get("result") not in ("ok", "not found"):
+        raise RuntimeError(f"Cloudinary destroy returned {result}")
+
+@jobs.handler("index_image_features", concurrency=2)
+def index_image_features(payload: dict):
+    # jobs queued before image_id was added used the public_id as doc id
+    image_id = payload.get("image_id", payload["public_id"])
+    feature_index.add(image_id, fetch_features(payload["public_id"]))
+
+@router.delete("/{image_id}")
+def delete_image(image_id: str, user: CurrentUser = Depends(verify_firebase_token)):
+    doc_ref = db.collection("images").document(image_id)
     doc = doc_ref.get()
     if not doc.exists:
         raise HTTPException(status_code=404, detail="Not found")
@@ -194,11 +290,11 @@ def delete_image(public_id: str, user: CurrentUser = Depends(verify_firebase_tok
     # permission: uploader or editor/admin
     if user.uid != rec.get("uploaded_by") and user.role not in ("editor", "admin"):
         raise HTTPException(status_code=403, detail="Permission denied")
-    # delete from Cloudinary and Firestore
-    try:
-        cloudinary.uploader.destroy(public_id, invalidate=True, resource_type="image")
-    except Exception as e:
-        # log but continue to remove metadata
-        pass
+    # remove metadata now; Cloudinary and comment cleanup run as retried background jobs
     doc_ref.delete()
-    return {"ok": True, "deleted": public_id}
+    record_facet_change(rec, None)
+    feature_index.remove(image_id)
+    # /api/upload docs older than the public_id field only carry the URL
+    jobs.enqueue("destroy_cloudinary_asset", {"public_id": cloudinary_public_id(image_id, rec)})
+    jobs.enqueue("purge_image_comments", {"image_id": image_id})
+    return {"ok": True, "deleted": image_id}
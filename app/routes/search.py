@@ -1,58 +1,217 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+from google.cloud import firestore
+from google.cloud.firestore import FieldFilter
 from app.utils.firebase_auth import db
-from app.schemas import SearchQuery
+from app.schemas import SearchQuery, GeoSearchQuery, SimilarQuery
+from app.utils import geo
+from app.utils.features import feature_index
+import numpy as np
+from app.utils.facets import get_facet_counts
+from app.utils.exif import normalize_camera_name, without_exif
+from app.utils.responses import FirestoreJSONResponse
 
 router = APIRouter()
 
+# how many docs to pull when the keyword filter still has to run in Python
+KEYWORD_SCAN_LIMIT = 500
+# geohash cells (= prefix range queries) used to cover a search area
+GEO_MAX_CELLS = 16
+# documents read per round trip while scanning a cell
+GEO_PAGE_SIZE = 300
+geo_pool = ThreadPoolExecutor(max_workers=16)
+
+
+def build_query(payload: SearchQuery):
+    """
+    Push album/license/camera/date filters down to Firestore.
+    Needs composite indexes on (album_id|license|camera_model, uploaded_at).
+    """
+    query = db.collection("images")
+
+    if payload.album_id:
+        query = query.where(filter=FieldFilter("album_id", "==", payload.album_id))
+    if payload.license:
+        query = query.where(filter=FieldFilter("license", "==", payload.license))
+    camera = normalize_camera_name(payload.camera or "")
+    if camera:
+        query = query.where(filter=FieldFilter("camera_model", "==", camera))
+
+    # uploaded_at is a native timestamp (see app/utils/migrations.py)
+    if payload.from_date:
+        start = datetime.combine(payload.from_date, time.min)
+        query = query.where(filter=FieldFilter("uploaded_at", ">=", start))
+    if payload.to_date:
+        end = datetime.combine(payload.to_date + timedelta(days=1), time.min)
+        query = query.where(filter=FieldFilter("uploaded_at", "<", end))
+
+    return query.order_by("uploaded_at", direction=firestore.Query.DESCENDING)
+
+
+def matches_keyword(rec: dict, q: str) -> bool:
+    qlower = q.lower()
+    for f in ["title", "caption", "filename"]:
+        v = (rec.get(f) or "").lower()
+        if qlower in v:
+            return True
+    tags = rec.get("tags", [])
+    return any(qlower in str(t).lower() for t in tags)
+
+
 @router.post("/")
 def search(payload: SearchQuery):
-    images_ref = db.collection("images")
-    snapshot = images_ref.limit(500).stream()
+    limit = payload.limit or 50
+    query = build_query(payload)
+
+    # without a keyword every filter is indexed, so fetch exactly `limit` docs
+    snapshot = query.limit(KEYWORD_SCAN_LIMIT if payload.q else limit).stream()
     results = []
 
     for doc in snapshot:
         rec = doc.to_dict()
 
         # keyword search
-        if payload.q:
-            qlower = payload.q.lower()
-            matched = False
-            for f in ["title", "caption", "filename"]:
-                v = (rec.get(f) or "").lower()
-                if qlower in v:
-                    matched = True; break
-            if not matched:
-                tags = rec.get("tags", [])
-                if not any(qlower in str(t).lower() for t in tags):
+        if payload.q and not matches_keyword(rec, payload.q):
+            continue
+
+        results.append(without_exif(rec))
+        if len(results) >= limit:
+            break
+
+    response = {"count": len(results), "images": results}
+    if payload.facets:
+        response["facets"] = get_facet_counts()
+    return FirestoreJSONResponse(response)
+
+
+def _search_area(payload: GeoSearchQuery):
+    """(bounding box, circle or None) for a geo query."""
+    if None not in (payload.lat, payload.lon, payload.radius_km):
+        circle = (payload.lat, payload.lon, payload.radius_km)
+        return geo.radius_box(*circle), circle
+    box = (payload.min_lat, payload.min_lon, payload.max_lat, payload.max_lon)
+    if None in box:
+        raise HTTPException(status_code=400, detail="Provide a bounding box or lat/lon/radius_km")
+    if box[0] > box[2]:
+        raise HTTPException(status_code=400, detail="min_lat must not exceed max_lat")
+    return box, None
+
+
+def _cell_query(cell: str):
+    # only public images are placed on the map; needs an index on (privacy, geohash)
+    return (
+        db.collection("images")
+        .where(filter=FieldFilter("privacy", "==", "public"))
+        .where(filter=FieldFilter("geohash", ">=", cell))
+        .where(filter=FieldFilter("geohash", "<", cell + "~"))
+    )
+
+
+@router.post("/geo")
+def geo_search(payload: GeoSearchQuery):
+    """
+    Images inside a bounding box or radius. The area is covered by a few
+    geohash cells, each an indexed prefix range scan; exact bounds are
+    checked on the candidates, so each cell is paged through until it is
+    exhausted or `limit` images have been accepted.
+    """
+    box, circle = _search_area(payload)
+    limit = payload.limit or 200
+    results = []
+    for cell in geo.covering_cells(*box, max_cells=GEO_MAX_CELLS):
+        query = _cell_query(cell).order_by("geohash").limit(GEO_PAGE_SIZE)
+        last = None
+        while len(results) < limit:
+            page = query.start_after(last) if last is not None else query
+            docs = list(page.stream())
+            for doc in docs:
+                rec = doc.to_dict()
+                lat, lon = rec.get("lat"), rec.get("lon")
+                if lat is None or lon is None or not geo.in_box(lat, lon, *box):
+                    continue
+                if circle and geo.haversine_km(circle[0], circle[1], lat, lon) > circle[2]:
                     continue
+                results.append(without_exif(rec))
+                if len(results) >= limit:
+                    break
+            if len(docs) < GEO_PAGE_SIZE:
+                break
+            last = docs[-1]
+        if len(results) >= limit:
+            break
+    return FirestoreJSONResponse({"count": len(results), "images": results})
+
 
-        # album filter
-        if payload.album_id and rec.get("album_id") != payload.album_id:
+@router.post("/geo/clusters")
+def geo_clusters(payload: GeoSearchQuery):
+    """
+    Photo counts per geohash cell for a map viewport. Cell size follows the
+    viewport (i.e. the zoom level) so at most `max_clusters` (<= 32) come
+    back; each count is an index-only aggregation, run in parallel.
+    """
+    box, _ = _search_area(payload)
+    cells = geo.covering_cells(*box, max_cells=payload.max_clusters)
+
+    def _count(cell):
+        result = _cell_query(cell).count(alias="n").get()
+        return cell, int(result[0][0].value)
+
+    clusters = []
+    for cell, n in geo_pool.map(_count, cells):
+        if not n:
             continue
+        min_lat, min_lon, max_lat, max_lon = geo.decode_bounds(cell) if cell else (-90, -180, 90, 180)
+        clusters.append({
+            "geohash": cell,
+            "count": n,
+            "lat": (min_lat + max_lat) / 2,
+            "lon": (min_lon + max_lon) / 2,
+            "bounds": [min_lat, min_lon, max_lat, max_lon],
+        })
+    return {"count": len(clusters), "clusters": clusters}
 
-        # license filter
-        if payload.license and rec.get("license") != payload.license:
+
+def _similar_images(hits):
+    """Public image docs for (id, score) hits, best first."""
+    if not hits:
+        return []
+    refs = [db.collection("images").document(image_id) for image_id, _ in hits]
+    docs = {doc.id: doc.to_dict() for doc in db.get_all(refs) if doc.exists}
+    out = []
+    for image_id, score in hits:
+        rec = docs.get(image_id)
+        if rec is None or rec.get("privacy", "public") != "public":
             continue
+        out.append({**without_exif(rec), "score": score})
+    return out
 
-        # date range filter
-        if payload.from_date or payload.to_date:
-            uploaded_at = rec.get("uploaded_at")
-            if isinstance(uploaded_at, str):  # Firestore may store as string
-                uploaded_at = datetime.datetime.fromisoformat(uploaded_at)
-            if payload.from_date and uploaded_at.date() < payload.from_date:
-                continue
-            if payload.to_date and uploaded_at.date() > payload.to_date:
-                continue
-
-        # camera metadata filter
-        if payload.camera:
-            exif = rec.get("exif", {})
-            camera_model = (exif.get("Model") or "").lower()
-            if payload.camera.lower() not in camera_model:
-                continue
-
-        results.append(rec)
-        if len(results) >= (payload.limit or 50):
-            break
 
-    return {"count": len(results), "images": results}
+@router.post("/similar")
+def similar_batch(payload: SimilarQuery):
+    """
+    "More like this" for several images at once: one matrix product
+    scores every indexed image against all query vectors.
+    """
+    found = [(i, feature_index.vector(i)) for i in payload.ids]
+    found = [(i, v) for i, v in found if v is not None and v.any()]
+    results = {i: [] for i in payload.ids}
+    if found:
+        queries = np.stack([v for _, v in found])
+        # ask for a few extra to absorb private images filtered out below
+        hits = feature_index.top_k(queries, payload.k * 2, exclude=[i for i, _ in found])
+        for (image_id, _), image_hits in zip(found, hits):
+            results[image_id] = _similar_images(image_hits)[:payload.k]
+    return FirestoreJSONResponse({"results": results})
+
+
+@router.get("/similar/{image_id}")
+def similar(image_id: str, k: int = 20):
+    vec = feature_index.vector(image_id)
+    if vec is None or not vec.any():
+        raise HTTPException(status_code=404, detail="Image has not been indexed yet")
+    k = max(1, min(k, 100))
+    hits = feature_index.top_k(vec, k * 2, exclude=[image_id])[0]
+    images = _similar_images(hits)[:k]
+    return FirestoreJSONResponse({"count": len(images), "images": images})
+
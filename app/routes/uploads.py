@@ -0,0 +1,181 @@
+"""
+Resumable uploads for large originals (offset-based, tus-like).
+
+    POST   /              -> create an upload session, returns upload_id
+    HEAD   /{upload_id}   -> Upload-Offset header with the bytes received so far
+    PATCH  /{upload_id}   -> append a chunk at Upload-Offset (optional Upload-Checksum: sha256 hex)
+    POST   /{upload_id}/complete -> hand the staged file to Cloudinary + Firestore
+    DELETE /{upload_id}   -> abandon the upload
+"""
+import hashlib
+import os
+from typing import Optional
+import cloudinary.uploader
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from app.config import settings
+from app.schemas import ResumableUploadCreate
+from app.utils.firebase_auth import verify_firebase_token, CurrentUser
+from app.utils.ratelimit import run_upload_io
+from app.utils.staging import staging, StagingFull
+from app.utils.idempotency import sha256_file
+from app.routes.images import extract_exif, find_duplicate, save_image_metadata, upload_folder
+
+router = APIRouter()
+
+# Cloudinary's upload_large splits the transfer into chunks of this size
+CLOUDINARY_CHUNK_BYTES = 20 * 1024 ** 2
+
+
+def _status(meta: dict) -> dict:
+    return {
+        "upload_id": meta["id"],
+        "offset": meta["offset"],
+        "size": meta["size"],
+        "expires_at": meta["expires_at"],
+        "max_chunk_bytes": settings.UPLOAD_MAX_CHUNK_BYTES,
+    }
+
+
+def _owned(meta: dict, user: CurrentUser) -> dict:
+    if meta.get("uid") != user.uid:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return meta
+
+
+def _get_owned(upload_id: str, user: CurrentUser) -> dict:
+    try:
+        return _owned(staging.get(upload_id), user)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+
+@router.post("/", status_code=201)
+def create_upload(payload: ResumableUploadCreate, user: CurrentUser = Depends(verify_firebase_token)):
+    if payload.size > settings.UPLOAD_MAX_FILE_BYTES:
+        raise HTTPException(status_code=413, detail="File too large")
+    try:
+        meta = staging.create(user.uid, payload.size, payload.model_dump(exclude={"size"}))
+    except StagingFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Upload staging area is full, try again later.",
+            headers={"Retry-After": "60"},
+        )
+    return _status(meta)
+
+
+@router.head("/{upload_id}")
+def upload_offset(upload_id: str, user: CurrentUser = Depends(verify_firebase_token)):
+    meta = _get_owned(upload_id, user)
+    return Response(headers={"Upload-Offset": str(meta["offset"]), "Upload-Length": str(meta["size"])})
+
+
+@router.get("/{upload_id}")
+def upload_status(upload_id: str, user: CurrentUser = Depends(verify_firebase_token)):
+    return _status(_get_owned(upload_id, user))
+
+
+def _append_chunk(upload_id: str, user: CurrentUser, offset: int, chunk: bytes, checksum: Optional[str]) -> dict:
+    digest = hashlib.sha256(chunk).hexdigest()
+    if checksum and checksum.lower() != digest:
+        raise HTTPException(status_code=400, detail="Chunk checksum mismatch")
+    try:
+        with staging.locked(upload_id) as meta:
+            _owned(meta, user)
+            if offset != meta["offset"]:
+                raise HTTPException(
+                    status_code=409,
+                    detail="Upload-Offset does not match the received length",
+                    headers={"Upload-Offset": str(meta["offset"])},
+                )
+            if offset + len(chunk) > meta["size"]:
+                raise HTTPException(status_code=413, detail="Chunk exceeds declared upload size")
+            with open(staging.data_path(upload_id), "r+b") as f:
+                f.seek(offset)
+                f.write(chunk)
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+            return staging.commit_chunk(meta, len(chunk), digest)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+
+@router.patch("/{upload_id}")
+async def append_chunk(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., alias="Upload-Offset"),
+    upload_checksum: Optional[str] = Header(None, alias="Upload-Checksum"),
+    user: CurrentUser = Depends(verify_firebase_token),
+):
+    declared = request.headers.get("content-length")
+    if declared is not None and not declared.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid Content-Length")
+    if declared and int(declared) > settings.UPLOAD_MAX_CHUNK_BYTES:
+        raise HTTPException(status_code=413, detail="Chunk too large")
+    chunk = bytearray()
+    async for part in request.stream():
+        chunk.extend(part)
+        if len(chunk) > settings.UPLOAD_MAX_CHUNK_BYTES:
+            raise HTTPException(status_code=413, detail="Chunk too large")
+
+    meta = await run_upload_io(_append_chunk, upload_id, user, upload_offset, bytes(chunk), upload_checksum)
+    return Response(status_code=204, headers={"Upload-Offset": str(meta["offset"])})
+
+
+def _complete_upload(upload_id: str, user: CurrentUser) -> dict:
+    try:
+        with staging.locked(upload_id) as meta:
+            _owned(meta, user)
+            if meta["offset"] != meta["size"]:
+                raise HTTPException(
+                    status_code=409,
+                    detail="Upload is incomplete",
+                    headers={"Upload-Offset": str(meta["offset"])},
+                )
+            path = staging.data_path(upload_id)
+            digest = sha256_file(path)
+            existing = find_duplicate(user.uid, digest)
+            if existing is not None:
+                staging.remove(upload_id)
+                return existing
+            exif = extract_exif(path)
+            result = cloudinary.uploader.upload_large(
+                path,
+                folder=upload_folder(user.uid),
+                resource_type="image",
+                use_filename=True,
+                unique_filename=True,
+                chunk_size=CLOUDINARY_CHUNK_BYTES,
+                filename=meta.get("filename"),
+            )
+            data = save_image_metadata(
+                result,
+                filename=meta.get("filename"),
+                mime_type=meta.get("content_type"),
+                exif=exif,
+                user=user,
+                title=meta.get("title"),
+                album_id=meta.get("album_id"),
+                privacy=meta.get("privacy") or "public",
+                sha256=digest,
+            )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    staging.remove(upload_id)
+    return data
+
+
+@router.post("/{upload_id}/complete")
+async def complete_upload(upload_id: str, user: CurrentUser = Depends(verify_firebase_token)):
+    # admission is applied by UploadAdmissionMiddleware (see app.main.UPLOAD_PATHS)
+    data = await run_upload_io(_complete_upload, upload_id, user)
+    return {"ok": True, "id": data.get("id"), "public_id": data["public_id"], "url": data["url"]}
+
+
+@router.delete("/{upload_id}")
+def cancel_upload(upload_id: str, user: CurrentUser = Depends(verify_firebase_token)):
+    _get_owned(upload_id, user)
+    staging.remove(upload_id)
+    return {"ok": True, "deleted": upload_id}
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, List
 from uuid import UUID
 import datetime
@@ -50,6 +50,29 @@ class ImageEdit(BaseModel):
     tags: Optional[List[str]] = Field(None, description="List of tags associated with the image")
 
 
+class DirectUploadFinalize(BaseModel):
+    # everything else about the asset is read back from Cloudinary
+    model_config = ConfigDict(extra="forbid")
+
+    # fields echoed from Cloudinary's upload response
+    public_id: str = Field(..., description="Cloudinary public ID returned by the upload")
+    version: int = Field(..., description="Cloudinary asset version returned by the upload")
+    signature: str = Field(..., description="Cloudinary response signature over public_id and version")
+    # our own metadata
+    title: Optional[str] = Field(None, description="Title of the image")
+    album_id: Optional[str] = Field(None, description="Album ID to associate this image with")
+    privacy: str = Field("public", description="Privacy setting (e.g., public, private)")
+
+
+class ResumableUploadCreate(BaseModel):
+    filename: str = Field(..., description="Original filename of the image")
+    size: int = Field(..., gt=0, description="Total size of the file in bytes")
+    content_type: Optional[str] = Field(None, description="MIME type of the image (e.g., image/jpeg)")
+    title: Optional[str] = Field(None, description="Title of the image")
+    album_id: Optional[str] = Field(None, description="Album ID to associate this image with")
+    privacy: str = Field("public", description="Privacy setting (e.g., public, private)")
+
+
 # --------------------
 # Albums
 # --------------------
@@ -82,7 +105,7 @@ class SearchQuery(BaseModel):
         None, description="Filter images uploaded on or before this date (YYYY-MM-DD)"
     )
     camera: Optional[str] = Field(
-        None, description="Filter by camera model (from EXIF metadata)"
+        None, description="Filter by camera model (exact, case-insensitive match on EXIF Model)"
     )
     license: Optional[str] = Field(
         None, description="Filter by license type (e.g., CC-BY, All Rights Reserved)"
@@ -90,3 +113,30 @@ class SearchQuery(BaseModel):
     limit: Optional[int] = Field(
         50, ge=1, le=100, description="Maximum number of results to return (default 50, max 100)"
     )
+    facets: bool = Field(
+        False, description="Include library-wide counts per album, license and camera model"
+    )
+
+
+class GeoSearchQuery(BaseModel):
+    # either a bounding box...
+    min_lat: Optional[float] = Field(None, ge=-90, le=90, description="South edge of the bounding box")
+    min_lon: Optional[float] = Field(None, ge=-180, le=180, description="West edge (may exceed max_lon across the antimeridian)")
+    max_lat: Optional[float] = Field(None, ge=-90, le=90, description="North edge of the bounding box")
+    max_lon: Optional[float] = Field(None, ge=-180, le=180, description="East edge of the bounding box")
+    # ...or a circle
+    lat: Optional[float] = Field(None, ge=-90, le=90, description="Centre latitude for a radius search")
+    lon: Optional[float] = Field(None, ge=-180, le=180, description="Centre longitude for a radius search")
+    radius_km: Optional[float] = Field(None, gt=0, le=20000, description="Search radius in kilometres")
+    limit: Optional[int] = Field(
+        200, ge=1, le=1000, description="Maximum number of images to return (ignored for clusters)"
+    )
+    # each cluster is one count() aggregation, so keep this small
+    max_clusters: int = Field(
+        16, ge=1, le=32, description="Upper bound on clusters returned for the current map viewport"
+    )
+
+
+class SimilarQuery(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=50, description="Image IDs to find look-alikes for")
+    k: int = Field(20, ge=1, le=100, description="Number of similar images per query image")
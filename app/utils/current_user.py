@@ -0,0 +1,8 @@
+from typing import Optional
+
+
+class CurrentUser:
+    def __init__(self, uid: str, email: Optional[str], role: str):
+        self.uid = uid
+        self.email = email
+        self.role = role
@@ -0,0 +1,207 @@
+"""
+Push channel for like-count and comment events.
+
+Handlers publish to a topic per image; SSE clients subscribe to the images
+they have on screen. Each subscriber has a bounded queue: like counts are
+coalesced to the latest value, and if comments overflow the queue the
+client gets a single "resync" event telling it to refetch.
+
+With one worker `broker` is in-process. With several (WEB_CONCURRENCY > 1,
+which is also what `uvicorn --workers` defaults to) a like recorded by one
+worker must reach SSE clients held by another, so events go through an
+`events` table in the jobs SQLite database instead. Anything else with the
+same publish/subscribe/unsubscribe methods can be swapped in via
+set_broker().
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import closing
+from typing import Dict, Iterable, Optional, Set
+from app.config import settings
+from app.utils.responses import dumps
+
+log = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+EVENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    topic VARCHAR(200) NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+# rows only need to outlive one poll in every worker
+EVENT_RETENTION_SECONDS = 60
+
+
+class Subscription:
+    def __init__(self, topics: Iterable[str], loop: asyncio.AbstractEventLoop, maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        self.topics = set(topics)
+        self.loop = loop
+        self._events = deque()
+        self._maxsize = maxsize
+        self._latest_likes: Dict[str, dict] = {}
+        self._overflowed = False
+        self._ready = asyncio.Event()
+
+    def _push(self, event: dict) -> None:
+        # always runs on self.loop
+        if event.get("type") == "likes":
+            self._latest_likes[event["image_id"]] = event
+        elif len(self._events) >= self._maxsize:
+            self._events.clear()
+            self._overflowed = True
+        else:
+            self._events.append(event)
+        self._ready.set()
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Next event, or None if nothing arrived within `timeout` seconds."""
+        while True:
+            if self._overflowed:
+                self._overflowed = False
+                self._latest_likes.clear()
+                return {"type": "resync"}
+            if self._latest_likes:
+                _, event = self._latest_likes.popitem()
+                return event
+            if self._events:
+                return self._events.popleft()
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._subs: Dict[str, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, topics: Iterable[str]) -> Subscription:
+        sub = Subscription(topics, asyncio.get_running_loop())
+        with self._lock:
+            for topic in sub.topics:
+                self._subs.setdefault(topic, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            for topic in sub.topics:
+                subs = self._subs.get(topic)
+                if subs:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._subs[topic]
+
+    def publish(self, topic: str, event: dict) -> None:
+        """Safe to call from sync handlers running in the threadpool."""
+        with self._lock:
+            subs = list(self._subs.get(topic, ()))
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub._push, event)
+            except RuntimeError:
+                # loop already closed; the subscriber is gone
+                self.unsubscribe(sub)
+
+
+class SQLiteBroker:
+    """
+    Cross-process fan-out through SQLite (WAL). publish() appends a row;
+    each process runs one poller thread, started with its first
+    subscriber, that hands new rows to an InProcessBroker. Delivery
+    latency is at most `poll_seconds`.
+    """
+
+    def __init__(self, path: str, poll_seconds: float = 0.25):
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self._local = InProcessBroker()
+        self._lock = threading.Lock()
+        self._poller: Optional[threading.Thread] = None
+        with closing(self._open()) as conn:
+            conn.executescript(EVENTS_SCHEMA)
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    def subscribe(self, topics: Iterable[str]) -> Subscription:
+        with self._lock:
+            if self._poller is None:
+                # start from the current tail; older events are not replayed
+                with closing(self._open()) as conn:
+                    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+                self._poller = threading.Thread(target=self._poll, args=(last_id,), name="events-poller", daemon=True)
+                self._poller.start()
+        return self._local.subscribe(topics)
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        self._local.unsubscribe(sub)
+
+    def publish(self, topic: str, event: dict) -> None:
+        """Safe to call from sync handlers running in the threadpool."""
+        with closing(self._open()) as conn:
+            conn.execute(
+                "INSERT INTO events (topic, payload, created_at) VALUES (?, ?, ?)",
+                (topic, dumps(event).decode("utf-8"), time.time()),
+            )
+
+    def _poll(self, last_id: int) -> None:
+        conn = self._open()
+        pruned_at = 0.0
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                rows = conn.execute(
+                    "SELECT id, topic, payload FROM events WHERE id > ? ORDER BY id", (last_id,)
+                ).fetchall()
+                for row_id, topic, payload in rows:
+                    last_id = row_id
+                    self._local.publish(topic, json.loads(payload))
+                now = time.time()
+                if now - pruned_at > EVENT_RETENTION_SECONDS:
+                    pruned_at = now
+                    conn.execute("DELETE FROM events WHERE created_at < ?", (now - EVENT_RETENTION_SECONDS,))
+            except sqlite3.Error:
+                log.exception("event poll failed")
+
+
+def _default_broker():
+    kind = settings.EVENTS_BROKER
+    if kind == "auto":
+        kind = "sqlite" if settings.WEB_CONCURRENCY > 1 else "memory"
+    if kind == "sqlite":
+        return SQLiteBroker(settings.JOBS_DB_PATH, settings.EVENTS_POLL_SECONDS)
+    return InProcessBroker()
+
+
+broker = _default_broker()
+
+
+def set_broker(new_broker) -> None:
+    global broker
+    broker = new_broker
+
+
+def publish(image_id: str, event: dict) -> None:
+    broker.publish(f"image:{image_id}", {**event, "image_id": image_id})
+
+
+def subscribe(image_ids: Iterable[str]) -> Subscription:
+    return broker.subscribe(f"image:{i}" for i in image_ids)
+
+
+def unsubscribe(sub: Subscription) -> None:
+    broker.unsubscribe(sub)
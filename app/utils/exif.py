@@ -0,0 +1,77 @@
+"""
+EXIF helpers shared by every upload path.
+"""
+from io import BytesIO
+from typing import Optional
+from PIL import Image, ExifTags
+
+def extract_exif_bytes(b: bytes):
+    return extract_exif(BytesIO(b))
+
+def extract_exif(fp):
+    """EXIF tag map from a path or file object; PIL only reads the header."""
+    try:
+        with Image.open(fp) as img:
+            raw = getattr(img, "_getexif", lambda: {})() or {}
+        exif = {}
+        for k, v in raw.items():
+            name = ExifTags.TAGS.get(k, k)
+            exif[name] = v
+        return exif
+    except Exception:
+        return {}
+
+# tags that are large opaque blobs and useless to API clients
+EXIF_DROP_TAGS = {"MakerNote", "UserComment", "PrintImageMatching", "ComponentsConfiguration"}
+
+def compact_exif(value, tags=ExifTags.TAGS):
+    """
+    Turn a raw PIL EXIF map into plain JSON/Firestore-safe values:
+    string keys, floats for rationals, no binary blobs.
+    """
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.items():
+            name = tags.get(k, k) if isinstance(k, int) else k
+            if name in EXIF_DROP_TAGS:
+                continue
+            sub_tags = ExifTags.GPSTAGS if name == "GPSInfo" else tags
+            v = compact_exif(v, sub_tags)
+            if v is not None:
+                out[str(name)] = v
+        return out
+    if isinstance(value, (tuple, list)):
+        items = [compact_exif(v, tags) for v in value]
+        return [v for v in items if v is not None]
+    if isinstance(value, (bytes, bytearray)):
+        return None
+    if isinstance(value, str):
+        return value.replace("\x00", "").strip()
+    if isinstance(value, (bool, int)):
+        return value
+    try:
+        return float(value)  # IFDRational
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+
+def without_exif(rec: dict) -> dict:
+    rec.pop("exif", None)
+    return rec
+
+def normalize_camera_name(model: str) -> Optional[str]:
+    """
+    Lowercased, whitespace-collapsed camera name. Used for both the stored
+    `camera_model` and the search filter value, so the two always compare equal.
+    """
+    model = " ".join(model.replace("\x00", " ").split()).lower()
+    return model or None
+
+def normalize_camera_model(exif: dict) -> Optional[str]:
+    """
+    Normalized EXIF Model, stored as `camera_model` so search can filter
+    with an equality query.
+    """
+    model = exif.get("Model") if exif else None
+    if not isinstance(model, str):
+        return None
+    return normalize_camera_name(model)
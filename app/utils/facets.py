@@ -0,0 +1,126 @@
+"""
+Precomputed facet counts for search.
+
+Each (field, value) pair has a few counter shards in the `facets`
+collection. Upload, edit and delete apply +1/-1 deltas, so reading the
+counts costs one small query regardless of library size. Only public
+images are counted.
+
+Repair drift with:  python -m app.utils.facets rebuild
+"""
+import hashlib
+import random
+import sys
+from collections import defaultdict
+from typing import Dict, Optional
+from google.cloud import firestore
+from app.utils.firebase_auth import db
+
+FACET_FIELDS = ("album_id", "license", "camera_model")
+FACETS_COLLECTION = "facets"
+# spread writes so bulk uploads into one album don't hit the per-doc write limit
+FACET_SHARDS = 4
+
+
+def _counter_ref(field: str, value: str, shard: int):
+    digest = hashlib.sha1(f"{field}\x00{value}".encode("utf-8")).hexdigest()[:20]
+    return db.collection(FACETS_COLLECTION).document(f"{field}-{digest}-{shard}")
+
+
+def _facet_values(rec: Optional[dict]) -> Dict[str, str]:
+    # counts are served to anonymous search callers, so only public images count;
+    # a privacy change then shows up as a plain delta between old and new values
+    if not rec or rec.get("privacy", "public") != "public":
+        return {}
+    out = {}
+    for field in FACET_FIELDS:
+        value = rec.get(field)
+        if isinstance(value, str) and value:
+            out[field] = value
+    return out
+
+
+def record_facet_change(old: Optional[dict], new: Optional[dict]) -> None:
+    """
+    Apply the facet delta between two versions of an image document.
+    Pass old=None for an upload and new=None for a delete.
+    """
+    before = _facet_values(old)
+    after = _facet_values(new)
+    deltas = []
+    for field in FACET_FIELDS:
+        if before.get(field) == after.get(field):
+            continue
+        if field in before:
+            deltas.append((field, before[field], -1))
+        if field in after:
+            deltas.append((field, after[field], 1))
+    if not deltas:
+        return
+
+    batch = db.batch()
+    for field, value, delta in deltas:
+        ref = _counter_ref(field, value, random.randrange(FACET_SHARDS))
+        batch.set(
+            ref,
+            {"field": field, "value": value, "count": firestore.Increment(delta)},
+            merge=True,
+        )
+    batch.commit()
+
+
+def get_facet_counts() -> Dict[str, Dict[str, int]]:
+    """Sum counter shards into {field: {value: count}}; zero counts are omitted."""
+    totals: Dict[str, Dict[str, int]] = {field: defaultdict(int) for field in FACET_FIELDS}
+    for doc in db.collection(FACETS_COLLECTION).stream():
+        rec = doc.to_dict() or {}
+        field = rec.get("field")
+        if field in totals:
+            totals[field][rec.get("value")] += int(rec.get("count") or 0)
+    return {
+        field: {value: n for value, n in counts.items() if n > 0}
+        for field, counts in totals.items()
+    }
+
+
+def rebuild_facets() -> Dict[str, Dict[str, int]]:
+    """Recount every facet from the `images` collection and overwrite the counters."""
+    totals: Dict[str, Dict[str, int]] = {field: defaultdict(int) for field in FACET_FIELDS}
+    for doc in db.collection("images").stream():
+        for field, value in _facet_values(doc.to_dict()).items():
+            totals[field][value] += 1
+
+    batch = db.batch()
+    pending = 0
+
+    def _flush():
+        nonlocal batch, pending
+        if pending:
+            batch.commit()
+        batch = db.batch()
+        pending = 0
+
+    for doc in db.collection(FACETS_COLLECTION).stream():
+        batch.delete(doc.reference)
+        pending += 1
+        if pending >= 400:
+            _flush()
+    _flush()
+
+    for field, counts in totals.items():
+        for value, n in counts.items():
+            batch.set(_counter_ref(field, value, 0), {"field": field, "value": value, "count": n})
+            pending += 1
+            if pending >= 400:
+                _flush()
+    _flush()
+
+    return {field: dict(counts) for field, counts in totals.items()}
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        print("usage: python -m app.utils.facets rebuild")
+        sys.exit(2)
+    counts = rebuild_facets()
+    print({field: len(values) for field, values in counts.items()})
@@ -0,0 +1,307 @@
+"""
+Compact visual feature vectors for "more like this" search.
+
+Each image is decoded at low resolution and described by a joint HSV
+colour histogram plus gradient magnitude/orientation histograms, packed
+into one L2-normalised float32 vector. Vectors live in an append-only
+raw float32 file (memory-mapped for queries) with a parallel id file,
+so cosine top-k over the whole library is a single matrix product.
+
+Backfill existing images with:  python -m app.utils.features backfill
+"""
+import fcntl
+import math
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Collection, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import requests
+import cloudinary.utils
+from PIL import Image
+from app.config import settings
+
+THUMB_SIZE = 128
+H_BINS, S_BINS, V_BINS = 8, 4, 4
+EDGE_BINS = 8
+COLOR_WEIGHT = 0.85
+DIM = H_BINS * S_BINS * V_BINS + 2 * EDGE_BINS
+# rows scored per matrix product; bounds temporary memory for big libraries
+QUERY_CHUNK_ROWS = 65536
+
+
+def compute_features(fp) -> np.ndarray:
+    """Feature vector (float32, unit length) for an image path or file object."""
+    with Image.open(fp) as img:
+        # JPEG decoders can scale by 1/2..1/8 during decode, which is far cheaper
+        img.draft("RGB", (THUMB_SIZE * 2, THUMB_SIZE * 2))
+        img = img.convert("RGB")
+        img.thumbnail((THUMB_SIZE, THUMB_SIZE))
+        hsv = np.asarray(img.convert("HSV"), dtype=np.uint16)
+        gray = np.asarray(img.convert("L"), dtype=np.float32)
+
+    h = (hsv[..., 0] * H_BINS) >> 8
+    s = (hsv[..., 1] * S_BINS) >> 8
+    v = (hsv[..., 2] * V_BINS) >> 8
+    bins = ((h * S_BINS + s) * V_BINS + v).ravel()
+    color = np.bincount(bins, minlength=H_BINS * S_BINS * V_BINS).astype(np.float32)
+    # Hellinger mapping keeps a dominant colour from swamping the cosine
+    color = np.sqrt(color / max(color.sum(), 1.0))
+
+    gx = np.diff(gray, axis=1)[:-1, :]
+    gy = np.diff(gray, axis=0)[:, :-1]
+    mag = np.hypot(gx, gy).ravel()
+    ang = (np.arctan2(gy, gx).ravel() % math.pi)
+    mag_bins = np.minimum((mag / (255.0 * math.sqrt(2)) * EDGE_BINS).astype(np.int64), EDGE_BINS - 1)
+    ang_bins = np.minimum((ang / math.pi * EDGE_BINS).astype(np.int64), EDGE_BINS - 1)
+    edge_mag = np.bincount(mag_bins, minlength=EDGE_BINS).astype(np.float32)
+    edge_ang = np.bincount(ang_bins, weights=mag, minlength=EDGE_BINS).astype(np.float32)
+    edges = np.concatenate([edge_mag / max(edge_mag.sum(), 1.0), edge_ang / max(edge_ang.sum(), 1e-6)])
+    edges = np.sqrt(edges)
+
+    vec = np.concatenate([
+        COLOR_WEIGHT * color / max(np.linalg.norm(color), 1e-6),
+        (1 - COLOR_WEIGHT) * edges / max(np.linalg.norm(edges), 1e-6),
+    ]).astype(np.float32)
+    return vec / max(np.linalg.norm(vec), 1e-6)
+
+
+_DELIVERY_URL = re.compile(r"/upload/(?:[^/]*/)*?v\d+/(.+)\.\w+$")
+
+
+def fetch_features(public_id: str) -> np.ndarray:
+    """Features from a small Cloudinary rendition, so we never pull the original."""
+    url, _ = cloudinary.utils.cloudinary_url(
+        public_id, width=THUMB_SIZE * 2, height=THUMB_SIZE * 2, crop="limit", format="jpg", secure=True
+    )
+    resp = requests.get(url, timeout=30)
+    resp.raise_for_status()
+    return compute_features(BytesIO(resp.content))
+
+
+class FeatureIndex:
+    """
+    Row i of `<path>` (raw float32, DIM wide) belongs to line i of
+    `<path>.ids`. Replaced or deleted rows are zeroed in place, so the
+    files only grow by appending until compact() rewrites them; readers in
+    other workers re-map when the vector file's size or inode changes.
+    """
+
+    def __init__(self, path: str, dim: int = DIM):
+        self.path = path
+        self.ids_path = path + ".ids"
+        self.lock_path = path + ".lock"
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._matrix = np.empty((0, dim), dtype=np.float32)
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+
+    def _refresh(self) -> None:
+        try:
+            st = os.stat(self.path)
+            stamp = (st.st_ino, st.st_size)
+        except FileNotFoundError:
+            stamp = (0, 0)
+        if stamp == self._stamp:
+            return
+        size = stamp[1]
+        n = size // (4 * self.dim)
+        if n:
+            self._matrix = np.memmap(self.path, dtype=np.float32, mode="r", shape=(n, self.dim))
+        else:
+            self._matrix = np.empty((0, self.dim), dtype=np.float32)
+        with open(self.ids_path, "a+") as f:
+            f.seek(0)
+            ids = f.read().split("\n")[:n]
+        self._ids = ids + [""] * (n - len(ids))
+        self._rows = {image_id: i for i, image_id in enumerate(self._ids) if image_id}
+        self._stamp = stamp
+
+    def _file_lock(self):
+        fd = os.open(self.lock_path, os.O_CREAT | os.O_RDWR)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    def _zero_row(self, row: int) -> None:
+        with open(self.path, "r+b") as f:
+            f.seek(row * self.dim * 4)
+            f.write(np.zeros(self.dim, dtype=np.float32).tobytes())
+
+    def add(self, image_id: str, vec: np.ndarray) -> None:
+        vec = np.asarray(vec, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            fd = self._file_lock()
+            try:
+                self._refresh()
+                old = self._rows.get(image_id)
+                if old is not None:
+                    self._zero_row(old)
+                # rows are counted from the vector file, so write the id first
+                with open(self.ids_path, "a") as f:
+                    f.write(image_id + "\n")
+                with open(self.path, "ab") as f:
+                    f.write(vec.tobytes())
+                self._refresh()
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def remove(self, image_id: str) -> None:
+        with self._lock:
+            fd = self._file_lock()
+            try:
+                self._stamp = None
+                self._refresh()
+                row = self._rows.pop(image_id, None)
+                if row is not None:
+                    self._zero_row(row)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def compact(self, keep: Optional[Collection[str]] = None) -> int:
+        """
+        Rewrite the files with only live rows (and, if given, only ids in
+        `keep`), dropping zeroed and superseded ones. Returns rows dropped.
+        """
+        with self._lock:
+            fd = self._file_lock()
+            try:
+                self._stamp = None
+                self._refresh()
+                live = sorted(
+                    (row, image_id) for image_id, row in self._rows.items()
+                    if (keep is None or image_id in keep) and self._matrix[row].any()
+                )
+                dropped = len(self._ids) - len(live)
+                if not dropped:
+                    return 0
+                with open(self.ids_path + ".tmp", "w") as f:
+                    f.writelines(image_id + "\n" for _, image_id in live)
+                rows = np.array([row for row, _ in live], dtype=np.int64)
+                with open(self.path + ".tmp", "wb") as f:
+                    for start in range(0, len(rows), QUERY_CHUNK_ROWS):
+                        f.write(np.ascontiguousarray(self._matrix[rows[start:start + QUERY_CHUNK_ROWS]]).tobytes())
+                # ids first: readers only re-map once the vector file changes
+                os.replace(self.ids_path + ".tmp", self.ids_path)
+                os.replace(self.path + ".tmp", self.path)
+                self._stamp = None
+                self._refresh()
+                return dropped
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def __contains__(self, image_id: str) -> bool:
+        with self._lock:
+            self._refresh()
+            return image_id in self._rows
+
+    def vector(self, image_id: str) -> Optional[np.ndarray]:
+        with self._lock:
+            self._refresh()
+            row = self._rows.get(image_id)
+            return None if row is None else np.array(self._matrix[row])
+
+    def top_k(self, queries: np.ndarray, k: int, exclude: Sequence[str] = ()) -> List[List[Tuple[str, float]]]:
+        """
+        Cosine top-k for a batch of unit query vectors (b x DIM). Rows are
+        scored in chunks with one matrix product each.
+        """
+        with self._lock:
+            self._refresh()
+            matrix, ids, rows = self._matrix, self._ids, self._rows
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        n = matrix.shape[0]
+        want = min(n, k + len(exclude) + 1)
+        if not n or not want:
+            return [[] for _ in range(len(queries))]
+
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, n, QUERY_CHUNK_ROWS):
+            block = np.asarray(matrix[start:start + QUERY_CHUNK_ROWS])
+            scores = queries @ block.T  # b x chunk
+            take = min(want, scores.shape[1])
+            idx = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, idx, axis=1)], axis=1)
+            best_rows = np.concatenate([best_rows, idx + start], axis=1)
+            if best_scores.shape[1] > want:
+                keep = np.argpartition(-best_scores, want - 1, axis=1)[:, :want]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        excluded = set(exclude)
+        out = []
+        for scores, rws in zip(best_scores, best_rows):
+            order = np.argsort(-scores)
+            hits = []
+            for j in order:
+                row = int(rws[j])
+                image_id = ids[row]
+                # zeroed rows and superseded copies are not live
+                if scores[j] <= 0 or rows.get(image_id) != row or image_id in excluded:
+                    continue
+                hits.append((image_id, float(scores[j])))
+                if len(hits) >= k:
+                    break
+            out.append(hits)
+        return out
+
+
+feature_index = FeatureIndex(settings.FEATURES_PATH)
+
+
+def cloudinary_public_id(image_id: str, rec: dict) -> str:
+    """
+    The Cloudinary public_id behind an image document. Uploads store it as
+    `public_id`; older docs only have the delivery URL
+    (.../upload/v123/<folder>/<id>.jpg).
+    """
+    if rec.get("public_id"):
+        return rec["public_id"]
+    match = _DELIVERY_URL.search(rec.get("url") or "")
+    return match.group(1) if match else image_id
+
+
+def backfill(force: bool = False, workers: int = 8) -> int:
+    """
+    Index every image that has no vector yet. With force, re-index all of
+    them and then compact the index down to the images that still exist.
+    """
+    from app.utils.firebase_auth import db
+    import app.routes.images  # noqa: F401  configures Cloudinary
+
+    # the index is keyed by doc id (what search looks up); pixels come from Cloudinary
+    images = {
+        doc.id: cloudinary_public_id(doc.id, doc.to_dict() or {})
+        for doc in db.collection("images").select(["public_id", "url"]).stream()
+    }
+    todo = [item for item in images.items() if force or item[0] not in feature_index]
+
+    def _index(item: Tuple[str, str]) -> bool:
+        image_id, public_id = item
+        try:
+            feature_index.add(image_id, fetch_features(public_id))
+            return True
+        except Exception as e:
+            print(f"skipping {image_id} ({public_id}): {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        indexed = sum(pool.map(_index, todo))
+    if force:
+        print(f"compacted away {feature_index.compact(keep=images)} stale rows")
+    return indexed
+
+
+if __name__ == "__main__":
+    if not sys.argv[1:] or sys.argv[1] != "backfill":
+        print("usage: python -m app.utils.features backfill [--force]")
+        sys.exit(2)
+    print(f"Indexed {backfill(force='--force' in sys.argv[2:])} images")
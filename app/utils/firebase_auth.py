@@ -3,6 +3,7 @@ from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 import firebase_admin
 from firebase_admin import credentials, auth, firestore
 from app.config import settings
+from app.utils.current_user import CurrentUser
 from typing import Optional
 
 # Initialize Firebase Admin once
@@ -16,12 +17,6 @@ if not firebase_admin._apps:
 db = firestore.client()
 security = HTTPBearer()
 
-class CurrentUser:
-    def __init__(self, uid: str, email: Optional[str], role: str):
-        self.uid = uid
-        self.email = email
-        self.role = role
-
 def verify_firebase_token(creds: HTTPAuthorizationCredentials = Security(security)) -> CurrentUser:
     token = creds.credentials
     try:
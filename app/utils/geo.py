@@ -0,0 +1,196 @@
+"""
+GPS decoding and geohash helpers for location search.
+
+Images with GPS EXIF get `lat`, `lon` and a 9-character `geohash`. A
+bounding box is covered by a handful of geohash cells, and each cell is
+one indexed prefix range query (geohash >= cell, < cell + "~").
+"""
+import math
+import re
+from typing import Iterable, List, Optional, Tuple
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9   # ~5m cells
+EARTH_RADIUS_KM = 6371.0088
+# Cloudinary's image_metadata is flat ExifTool output, e.g. `37 deg 46' 30.00" N`
+_NUMBER = re.compile(r"[-+]?\d+(?:\.\d+)?")
+
+
+def _dms_to_degrees(value, ref) -> Optional[float]:
+    try:
+        if isinstance(value, (int, float)):
+            degrees = float(value)
+        else:
+            if isinstance(value, str):
+                # a trailing hemisphere letter overrides a separate ref tag
+                hemisphere = value.strip()[-1:].upper()
+                if hemisphere in ("N", "S", "E", "W"):
+                    ref = hemisphere
+                value = _NUMBER.findall(value)
+            parts = [float(v) for v in value]
+            degrees = parts[0] + (parts[1] if len(parts) > 1 else 0) / 60 + (parts[2] if len(parts) > 2 else 0) / 3600
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    if isinstance(ref, bytes):
+        ref = ref.decode("ascii", "ignore")
+    # "S"/"W" from PIL, "South"/"West" from Cloudinary
+    if isinstance(ref, str) and ref.strip().upper()[:1] in ("S", "W"):
+        degrees = -degrees
+    return degrees
+
+
+def gps_from_exif(exif: dict) -> Optional[Tuple[float, float]]:
+    """
+    (lat, lon) from an EXIF map's GPSInfo block, or from the top-level GPS
+    tags of Cloudinary's image_metadata; None if absent/invalid.
+    """
+    gps = (exif or {}).get("GPSInfo")
+    if not isinstance(gps, dict):
+        gps = {k: v for k, v in (exif or {}).items() if isinstance(k, str)}
+    # accept both named tags (compact_exif) and raw numeric tag ids
+    lat = _dms_to_degrees(gps.get("GPSLatitude", gps.get(2)), gps.get("GPSLatitudeRef", gps.get(1)))
+    lon = _dms_to_degrees(gps.get("GPSLongitude", gps.get(4)), gps.get("GPSLongitudeRef", gps.get(3)))
+    if lat is None or lon is None:
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or (lat == 0 and lon == 0):
+        return None
+    return lat, lon
+
+
+def encode(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    out = []
+    bits = 0
+    nbits = 0
+    even = True
+    while len(out) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                bits = (bits << 1) | 1
+                lon_lo = mid
+            else:
+                bits <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_lo = mid
+            else:
+                bits <<= 1
+                lat_hi = mid
+        even = not even
+        nbits += 1
+        if nbits == 5:
+            out.append(BASE32[bits])
+            bits = 0
+            nbits = 0
+    return "".join(out)
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """(lat height, lon width) in degrees of a geohash cell."""
+    total = 5 * precision
+    lon_bits = (total + 1) // 2
+    lat_bits = total // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def decode_bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """(min_lat, min_lon, max_lat, max_lon) of a geohash cell."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    even = True
+    for ch in geohash:
+        value = BASE32.index(ch)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                lon_lo, lon_hi = (mid, lon_hi) if bit else (lon_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return lat_lo, lon_lo, lat_hi, lon_hi
+
+
+def _split_antimeridian(min_lat, min_lon, max_lat, max_lon):
+    if min_lon <= max_lon:
+        return [(min_lat, min_lon, max_lat, max_lon)]
+    return [(min_lat, min_lon, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lon)]
+
+
+def _cells_at(boxes, precision: int) -> List[str]:
+    h, w = cell_size(precision)
+    cells = []
+    for min_lat, min_lon, max_lat, max_lon in boxes:
+        i0 = int(math.floor((min_lat + 90) / h))
+        i1 = int(math.floor((min(max_lat, 90 - 1e-9) + 90) / h))
+        j0 = int(math.floor((min_lon + 180) / w))
+        j1 = int(math.floor((min(max_lon, 180 - 1e-9) + 180) / w))
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                cells.append(encode(-90 + (i + 0.5) * h, -180 + (j + 0.5) * w, precision))
+    return sorted(set(cells))
+
+
+def covering_cells(min_lat, min_lon, max_lat, max_lon, max_cells: int = 32) -> List[str]:
+    """
+    The finest set of geohash cells (at most `max_cells`) that covers the
+    box. Handles boxes that cross the antimeridian (min_lon > max_lon).
+    """
+    boxes = _split_antimeridian(min_lat, min_lon, max_lat, max_lon)
+    best = [""]  # a single empty prefix covers the world
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        h, w = cell_size(precision)
+        estimate = sum(
+            (math.floor((b[2] + 90) / h) - math.floor((b[0] + 90) / h) + 1)
+            * (math.floor((b[3] + 180) / w) - math.floor((b[1] + 180) / w) + 1)
+            for b in boxes
+        )
+        if estimate > max_cells:
+            break
+        best = _cells_at(boxes, precision)
+    return best
+
+
+def in_box(lat, lon, min_lat, min_lon, max_lat, max_lon) -> bool:
+    if not (min_lat <= lat <= max_lat):
+        return False
+    if min_lon <= max_lon:
+        return min_lon <= lon <= max_lon
+    return lon >= min_lon or lon <= max_lon
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def radius_box(lat, lon, radius_km) -> Tuple[float, float, float, float]:
+    """Bounding box of a circle, for turning a radius query into cell scans."""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    if min_lat <= -90 or max_lat >= 90:
+        return min_lat, -180.0, max_lat, 180.0
+    dlon = math.degrees(radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(lat))))
+    if dlon >= 180:
+        return min_lat, -180.0, max_lat, 180.0
+    min_lon = ((lon - dlon + 180) % 360) - 180
+    max_lon = ((lon + dlon + 180) % 360) - 180
+    return min_lat, min_lon, max_lat, max_lon
+
+
+def location_fields(exif: dict) -> dict:
+    """Firestore fields to store for an image's location (all None if unknown)."""
+    coords = gps_from_exif(exif)
+    if coords is None:
+        return {"lat": None, "lon": None, "geohash": None}
+    lat, lon = coords
+    return {"lat": lat, "lon": lon, "geohash": encode(lat, lon)}
@@ -0,0 +1,110 @@
+"""
+Idempotency-Key support and content hashing for upload retries.
+
+A key is reserved in Firestore before the upload starts and its response
+is stored when it finishes, so a retried request replays the first result
+instead of creating a second asset. Keys are scoped per caller and tied to
+the SHA-256 of the uploaded bytes; reusing a key for different content is
+rejected.
+"""
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+from fastapi import HTTPException, UploadFile
+from google.api_core.exceptions import AlreadyExists
+from google.cloud import firestore
+from app.config import settings
+
+READ_CHUNK_BYTES = 1024 * 1024
+# a reservation this old is assumed to belong to a crashed request
+PENDING_TIMEOUT = timedelta(minutes=5)
+
+
+async def read_upload(file: UploadFile) -> Tuple[bytes, str]:
+    """Read an UploadFile in chunks, hashing as we go; returns (bytes, sha256 hex)."""
+    hasher = hashlib.sha256()
+    parts = []
+    while True:
+        chunk = await file.read(READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        hasher.update(chunk)
+        parts.append(chunk)
+    return b"".join(parts), hasher.hexdigest()
+
+
+def sha256_file(fp) -> str:
+    """SHA-256 of a path or binary file object, without loading it whole."""
+    hasher = hashlib.sha256()
+    if isinstance(fp, str):
+        with open(fp, "rb") as f:
+            return sha256_file(f)
+    start = fp.tell()
+    for chunk in iter(lambda: fp.read(READ_CHUNK_BYTES), b""):
+        hasher.update(chunk)
+    fp.seek(start)
+    return hasher.hexdigest()
+
+
+@firestore.transactional
+def _reclaim(transaction, ref, pending: dict, now: datetime) -> Optional[dict]:
+    """Take over an expired or stale reservation; returns None if taken, else the record."""
+    rec = ref.get(transaction=transaction).to_dict() or {}
+    expired = rec.get("expires_at") is None or rec["expires_at"] <= now
+    stale = rec.get("status") == "pending" and rec.get("started_at", now) <= now - PENDING_TIMEOUT
+    if expired or stale:
+        transaction.set(ref, pending)
+        return None
+    return rec
+
+
+class IdempotencyStore:
+    def __init__(self, client, collection: str = "idempotency_keys", ttl_seconds: int = settings.IDEMPOTENCY_TTL_SECONDS):
+        self.client = client
+        self.collection = collection
+        self.ttl = timedelta(seconds=ttl_seconds)
+
+    def _ref(self, scope: str, key: str):
+        doc_id = hashlib.sha256(f"{scope}\x00{key}".encode("utf-8")).hexdigest()
+        return self.client.collection(self.collection).document(doc_id)
+
+    def begin(self, scope: str, key: str, fingerprint: str) -> Optional[dict]:
+        """
+        Reserve `key` for this request. Returns the stored response if the
+        key already completed; raises 409 while another attempt is running
+        and 422 if the key was used for different content.
+        """
+        ref = self._ref(scope, key)
+        now = datetime.now(timezone.utc)
+        pending = {
+            "status": "pending",
+            "fingerprint": fingerprint,
+            "started_at": now,
+            "expires_at": now + self.ttl,
+        }
+        try:
+            ref.create(pending)
+            return None
+        except AlreadyExists:
+            pass
+
+        # read-then-reclaim must be atomic, or two retries of a crashed
+        # request could both take over the stale reservation
+        rec = _reclaim(self.client.transaction(), ref, pending, now)
+        if rec is None:
+            return None
+        if rec.get("fingerprint") != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different upload")
+        if rec.get("status") == "pending":
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is still in progress",
+                headers={"Retry-After": "5"},
+            )
+        return rec.get("response")
+
+    def finish(self, scope: str, key: str, response: dict) -> None:
+        self._ref(scope, key).update({"status": "done", "response": response})
+
+    def abandon(self, scope: str, key: str) -> None:
+        self._ref(scope, key).delete()
@@ -0,0 +1,339 @@
+"""
+Durable background jobs backed by SQLite.
+
+Handlers enqueue work and return; asyncio workers started with the app
+claim jobs, run them, and retry failures with exponential backoff. Jobs
+are rows in the `jobs` table, so queued work survives restarts. A
+running job's lease is renewed while its handler runs; one left behind by
+a crashed process is re-queued once the lease expires, and a clean
+shutdown hands its running jobs straight back.
+
+    @jobs.handler("destroy_cloudinary_asset", concurrency=2)
+    def destroy(payload): ...
+
+    jobs.enqueue("destroy_cloudinary_asset", {"public_id": pid})
+"""
+import asyncio
+import inspect
+import json
+import logging
+import os
+import random
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+import anyio
+from app.config import settings
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type VARCHAR(80) NOT NULL,
+    payload TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    locked_by VARCHAR(80),
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_status_run_at ON jobs (status, run_at);
+"""
+
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 3600
+DONE_RETENTION_SECONDS = 7 * 24 * 3600
+# how often each process looks for expired leases
+RECOVER_INTERVAL_SECONDS = 60
+# transient queue errors (e.g. "database is locked") back off up to this long
+DB_BACKOFF_MAX_SECONDS = 30
+# after this many failed attempts to record a result, lease recovery reruns the job
+FINISH_ATTEMPTS = 5
+
+
+def _db_backoff(failures: int) -> float:
+    return min(DB_BACKOFF_MAX_SECONDS, 0.5 * 2 ** failures) * random.uniform(0.8, 1.2)
+
+
+class Handler:
+    def __init__(self, func: Callable, concurrency: int, max_attempts: int):
+        self.func = func
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+
+
+class JobQueue:
+    def __init__(self, path: str):
+        self.path = path
+        self.handlers: Dict[str, Handler] = {}
+        # pids repeat across containers/restarts; the suffix keeps ids unique
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex}"
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Dict[str, asyncio.Event] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        return conn
+
+    @contextmanager
+    def _connect(self):
+        conn = self._open()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    # ---- registration / enqueue ----
+
+    def handler(self, job_type: str, concurrency: int = 1, max_attempts: int = 5):
+        def decorator(func):
+            self.handlers[job_type] = Handler(func, concurrency, max_attempts)
+            return func
+        return decorator
+
+    def enqueue(self, job_type: str, payload: dict, delay: float = 0, max_attempts: Optional[int] = None) -> int:
+        """Persist a job; safe to call from sync or async handlers."""
+        if max_attempts is None:
+            handler = self.handlers.get(job_type)
+            max_attempts = handler.max_attempts if handler else 5
+        now = time.time()
+        with self._connect() as conn:
+            cur = conn.execute(
+                "INSERT INTO jobs (type, payload, max_attempts, run_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_type, json.dumps(payload), max_attempts, now + delay, now, now),
+            )
+            job_id = cur.lastrowid
+        self._notify(job_type)
+        return job_id
+
+    def _notify(self, job_type: str) -> None:
+        event = self._wake.get(job_type)
+        if event is not None and self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass
+
+    # ---- state transitions (run in threads) ----
+
+    def _claim(self, job_type: str) -> Optional[dict]:
+        now = time.time()
+        conn = self._open()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE type = ? AND status = 'queued' AND run_at <= ? "
+                "ORDER BY run_at, id LIMIT 1",
+                (job_type, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_by = ?, updated_at = ? "
+                "WHERE id = ?",
+                (self.worker_id, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+            job = dict(row)
+            job["attempts"] += 1
+            job["status"] = "running"
+            return job
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _finish(self, job: dict, error: Optional[str]) -> bool:
+        """Record the outcome; False if the job was meanwhile re-queued to another worker."""
+        now = time.time()
+        # only while we still hold the lock: after lease recovery the row is someone else's
+        owned = "WHERE id = ? AND status = 'running' AND locked_by = ?"
+        with self._connect() as conn:
+            if error is None:
+                cur = conn.execute(
+                    "UPDATE jobs SET status = 'done', last_error = NULL, locked_by = NULL, updated_at = ? " + owned,
+                    (now, job["id"], self.worker_id),
+                )
+            elif job["attempts"] >= job["max_attempts"]:
+                cur = conn.execute(
+                    "UPDATE jobs SET status = 'failed', last_error = ?, locked_by = NULL, updated_at = ? " + owned,
+                    (error, now, job["id"], self.worker_id),
+                )
+            else:
+                backoff = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (job["attempts"] - 1))
+                backoff *= random.uniform(0.8, 1.2)
+                cur = conn.execute(
+                    "UPDATE jobs SET status = 'queued', run_at = ?, last_error = ?, locked_by = NULL, updated_at = ? "
+                    + owned,
+                    (now + backoff, error, now, job["id"], self.worker_id),
+                )
+            return cur.rowcount == 1
+
+    def _heartbeat(self, job_id: int) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET updated_at = ? WHERE id = ? AND status = 'running' AND locked_by = ?",
+                (time.time(), job_id, self.worker_id),
+            )
+
+    def _release(self) -> int:
+        """Requeue this worker's running jobs; the interrupted attempt doesn't count."""
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0), locked_by = NULL, "
+                "updated_at = ? WHERE status = 'running' AND locked_by = ?",
+                (time.time(), self.worker_id),
+            )
+            return cur.rowcount
+
+    def recover(self) -> int:
+        """Requeue jobs whose runner died, and drop old finished jobs."""
+        now = time.time()
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'queued', locked_by = NULL, updated_at = ? "
+                "WHERE status = 'running' AND updated_at < ?",
+                (now, now - settings.JOB_LEASE_SECONDS),
+            )
+            conn.execute(
+                "DELETE FROM jobs WHERE status = 'done' AND updated_at < ?",
+                (now - DONE_RETENTION_SECONDS,),
+            )
+            return cur.rowcount
+
+    # ---- workers ----
+
+    async def _keep_leased(self, job_id: int) -> None:
+        while True:
+            await asyncio.sleep(settings.JOB_LEASE_SECONDS / 3)
+            await anyio.to_thread.run_sync(self._heartbeat, job_id)
+
+    async def _recover_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(RECOVER_INTERVAL_SECONDS)
+            try:
+                await anyio.to_thread.run_sync(self.recover)
+            except Exception:
+                log.exception("Job recovery failed")
+
+    async def _run(self, job_type: str, handler: Handler) -> None:
+        wake = self._wake[job_type]
+        failures = 0
+        while True:
+            try:
+                job = await anyio.to_thread.run_sync(self._claim, job_type)
+                failures = 0
+            except Exception:
+                # e.g. "database is locked" under several workers; never let it end the loop
+                log.exception("Claiming a %s job failed", job_type)
+                await asyncio.sleep(_db_backoff(failures))
+                failures += 1
+                continue
+            if job is None:
+                wake.clear()
+                try:
+                    await asyncio.wait_for(wake.wait(), settings.JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            error = None
+            lease = asyncio.create_task(self._keep_leased(job["id"]))
+            try:
+                payload = json.loads(job["payload"])
+                if inspect.iscoroutinefunction(handler.func):
+                    await handler.func(payload)
+                else:
+                    await anyio.to_thread.run_sync(handler.func, payload)
+            except asyncio.CancelledError:
+                # shutting down mid-job: stop() requeues it
+                raise
+            except Exception as e:
+                log.exception("Job %s (%s) failed", job["id"], job_type)
+                error = f"{type(e).__name__}: {e}"
+            finally:
+                lease.cancel()
+            await self._record(job, error)
+
+    async def _record(self, job: dict, error: Optional[str]) -> None:
+        for attempt in range(FINISH_ATTEMPTS):
+            try:
+                if not await anyio.to_thread.run_sync(self._finish, job, error):
+                    log.warning("Job %s was re-queued while running; result dropped", job["id"])
+                return
+            except Exception:
+                log.exception("Recording the result of job %s failed", job["id"])
+                await asyncio.sleep(_db_backoff(attempt))
+        # still 'running' under our id with no heartbeat: lease recovery will rerun it
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        await anyio.to_thread.run_sync(self.recover)
+        self._tasks.append(asyncio.create_task(self._recover_periodically()))
+        for job_type, handler in self.handlers.items():
+            self._wake[job_type] = asyncio.Event()
+            for _ in range(handler.concurrency):
+                self._tasks.append(asyncio.create_task(self._run(job_type, handler)))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        released = await anyio.to_thread.run_sync(self._release)
+        if released:
+            log.info("Requeued %d interrupted job(s)", released)
+
+    # ---- inspection ----
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT type, status, COUNT(*) AS n FROM jobs GROUP BY type, status").fetchall()
+        out: Dict[str, Dict[str, int]] = {}
+        for row in rows:
+            out.setdefault(row["type"], {})[row["status"]] = row["n"]
+        return out
+
+    def list(self, status: Optional[str] = None, job_type: Optional[str] = None, limit: int = 50) -> List[dict]:
+        query = "SELECT * FROM jobs WHERE 1 = 1"
+        params: list = []
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        if job_type:
+            query += " AND type = ?"
+            params.append(job_type)
+        query += " ORDER BY updated_at DESC LIMIT ?"
+        params.append(limit)
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [{**dict(row), "payload": json.loads(row["payload"])} for row in rows]
+
+    def retry(self, job_id: int) -> bool:
+        """Put a failed job back in the queue with a fresh attempt budget."""
+        now = time.time()
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, run_at = ?, updated_at = ? "
+                "WHERE id = ? AND status = 'failed'",
+                (now, now, job_id),
+            )
+            return cur.rowcount == 1
+
+
+jobs = JobQueue(settings.JOBS_DB_PATH)
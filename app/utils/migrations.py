@@ -0,0 +1,132 @@
+"""
+One-off data migrations for the Firestore `images` collection.
+
+Run with:  python -m app.utils.migrations
+"""
+from datetime import datetime, timezone
+from typing import Optional
+from app.utils.firebase_auth import db
+from app.utils.exif import normalize_camera_model
+from app.utils.geo import location_fields
+
+PAGE_SIZE = 300  # Firestore batches are capped at 500 writes
+# router uploads used to be stored at images/<public_id>, and their
+# public_ids ("sunian-photos/<uid>/<name>") made that a subcollection path
+NESTED_IMAGES_PARENT = "sunian-photos"
+
+
+def _parse_uploaded_at(value) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return None  # already a native timestamp
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz=timezone.utc)
+    return None
+
+
+def normalize_image_documents() -> int:
+    """
+    Convert string `uploaded_at` values to timestamps and backfill
+    `camera_model`, `privacy`, location fields and `updated_at`. Safe to re-run;
+    returns docs updated.
+    """
+    updated = 0
+    last = None
+    while True:
+        query = db.collection("images").order_by("__name__").limit(PAGE_SIZE)
+        if last is not None:
+            query = query.start_after(last)
+        docs = list(query.stream())
+        if not docs:
+            break
+
+        batch = db.batch()
+        pending = 0
+        for doc in docs:
+            rec = doc.to_dict() or {}
+            updates = {}
+
+            uploaded_at = _parse_uploaded_at(rec.get("uploaded_at"))
+            if uploaded_at is not None:
+                updates["uploaded_at"] = uploaded_at
+            elif "uploaded_at" not in rec:
+                updates["uploaded_at"] = doc.create_time or datetime.now(timezone.utc)
+
+            camera_model = normalize_camera_model(rec.get("exif") or {})
+            if rec.get("camera_model") != camera_model:
+                updates["camera_model"] = camera_model
+
+            # equality filters (geo search) skip docs without the field;
+            # a missing privacy has always meant public
+            if "privacy" not in rec:
+                updates["privacy"] = "public"
+
+            if "updated_at" not in rec:
+                updates["updated_at"] = updates.get("uploaded_at") or rec.get("uploaded_at")
+
+            # re-derived every run: images finalized before flat Cloudinary GPS
+            # tags were understood were stored with an empty location
+            location = location_fields(rec.get("exif") or {})
+            if any(rec.get(k) != v for k, v in location.items()) or "geohash" not in rec:
+                updates.update(location)
+
+            if updates:
+                batch.update(doc.reference, updates)
+                pending += 1
+
+        if pending:
+            batch.commit()
+            updated += pending
+        last = docs[-1]
+
+    return updated
+
+
+def move_nested_image_documents() -> int:
+    """
+    Move images stored under images/sunian-photos/<uid>/<name> (and their
+    comments) to images/<image_doc_id(public_id)>, where queries on the
+    `images` collection can see them. Safe to re-run; returns docs moved.
+    Rebuild the facet counters afterwards.
+    """
+    from app.routes.images import image_doc_id
+
+    moved = 0
+    parent = db.collection("images").document(NESTED_IMAGES_PARENT)
+    for folder in parent.collections():
+        for doc in folder.stream():
+            rec = doc.to_dict() or {}
+            public_id = rec.get("public_id") or f"{NESTED_IMAGES_PARENT}/{folder.id}/{doc.id}"
+            image_id = image_doc_id(public_id)
+            target = db.collection("images").document(image_id)
+
+            # comments first, so an interrupted run leaves the original in place
+            while True:
+                comments = list(doc.reference.collection("comments").limit(PAGE_SIZE // 2).stream())
+                if not comments:
+                    break
+                batch = db.batch()
+                for comment in comments:
+                    data = {**(comment.to_dict() or {}), "image_id": image_id}
+                    batch.set(target.collection("comments").document(comment.id), data)
+                    batch.delete(comment.reference)
+                batch.commit()
+
+            batch = db.batch()
+            batch.set(target, {**rec, "id": image_id, "public_id": public_id})
+            batch.delete(doc.reference)
+            batch.commit()
+            moved += 1
+    return moved
+
+
+if __name__ == "__main__":
+    print(f"Moved {move_nested_image_documents()} nested image documents")
+    print(f"Normalized {normalize_image_documents()} image documents")
@@ -0,0 +1,161 @@
+"""
+Admission control for expensive endpoints.
+
+Uploads are throttled per caller with a token bucket (429) and capped
+globally with a non-blocking concurrency gate (503). Both responses carry
+a Retry-After header. UploadAdmissionMiddleware applies the check before
+the request body is read. Upload I/O also runs on its own thread limiter, so
+sync read handlers never wait behind Cloudinary transfers for a worker
+thread.
+"""
+import math
+import re
+import threading
+import time
+from typing import Callable, Dict, Optional, Sequence, Tuple
+import anyio
+from fastapi.responses import JSONResponse
+from app.config import settings
+
+
+class TokenBucket:
+    def __init__(self, rate_per_sec: float, capacity: int):
+        self.rate = rate_per_sec
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> Tuple[bool, float]:
+        """Consume one token; returns (allowed, seconds until a token is available)."""
+        # `now` may predate a bucket created in the same call
+        elapsed = max(0.0, now - self.updated)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = max(now, self.updated)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, 0.0
+        return False, (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Token buckets keyed by caller (uid, or client address for legacy routes)."""
+
+    def __init__(self, per_minute: float, burst: int, max_keys: int = 10000):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float) -> None:
+        # a bucket that has refilled completely carries no state worth keeping
+        full_after = self.burst / self.rate
+        stale = [k for k, b in self._buckets.items() if now - b.updated >= full_after]
+        for k in stale:
+            del self._buckets[k]
+
+    def hit(self, key: str) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._prune(now)
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+            return bucket.take(now)
+
+
+class ConcurrencyGate:
+    """
+    Non-blocking in-flight limit for one endpoint class. Tracks an EWMA of
+    hold time so a rejected caller gets a realistic Retry-After.
+    """
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self.avg_hold = 1.0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.active >= self.limit:
+                return False
+            self.active += 1
+            return True
+
+    def release(self, held_for: float) -> None:
+        with self._lock:
+            self.active -= 1
+            self.avg_hold = 0.8 * self.avg_hold + 0.2 * held_for
+
+    def retry_after(self) -> float:
+        return self.avg_hold
+
+
+upload_limiter = RateLimiter(settings.UPLOAD_RATE_PER_MINUTE, settings.UPLOAD_BURST)
+upload_gate = ConcurrencyGate("upload", settings.UPLOAD_MAX_CONCURRENCY)
+# dedicated thread budget for blocking upload I/O (separate from anyio's default pool)
+upload_threads = anyio.CapacityLimiter(settings.UPLOAD_MAX_CONCURRENCY)
+
+
+def _retry_header(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+def _try_admit(key: str) -> Optional[Tuple[int, str, float]]:
+    """
+    Take a token and an in-flight slot for `key`. Returns None when admitted
+    (caller must release upload_gate), else (status, detail, retry_after).
+    """
+    allowed, wait = upload_limiter.hit(key)
+    if not allowed:
+        return 429, "Too many uploads, slow down.", wait
+    if not upload_gate.try_acquire():
+        return 503, "Upload capacity exhausted, try again shortly.", upload_gate.retry_after()
+    return None
+
+
+class UploadAdmissionMiddleware:
+    """
+    Throttle matching POST/PATCH requests (429, or 503 when the upload
+    gate is full) before the body is read, so a throttled client is turned
+    away without streaming its file to the worker. `key_func(scope)` maps
+    the request to a bucket key; it may block (e.g. token verification)
+    and runs in a thread.
+    """
+
+    def __init__(self, app, paths: Sequence[str], key_func: Callable[[dict], str]):
+        self.app = app
+        self.patterns = [re.compile(p) for p in paths]
+        self.key_func = key_func
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in ("POST", "PATCH")
+            or not any(p.fullmatch(scope["path"]) for p in self.patterns)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        key = await anyio.to_thread.run_sync(self.key_func, scope)
+        rejected = _try_admit(key)
+        if rejected is not None:
+            status_code, detail, wait = rejected
+            response = JSONResponse({"detail": detail}, status_code=status_code, headers=_retry_header(wait))
+            await response(scope, receive, send)
+            return
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            upload_gate.release(time.monotonic() - started)
+
+
+async def run_upload_io(func, *args, **kwargs):
+    """Run a blocking upload call (Cloudinary, file reads) off the event loop."""
+    return await anyio.to_thread.run_sync(
+        lambda: func(*args, **kwargs), limiter=upload_threads
+    )
@@ -0,0 +1,50 @@
+"""
+orjson-backed JSON responses that understand Firestore and EXIF types.
+
+FastAPI runs jsonable_encoder over anything a route returns before the
+response class sees it, which is slow and fails on bytes. Routes that
+return Firestore documents should return FirestoreJSONResponse(...)
+directly so only orjson touches the data.
+"""
+import base64
+import datetime
+import numbers
+from typing import Any
+import orjson
+from fastapi.responses import JSONResponse
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def firestore_default(obj: Any) -> Any:
+    """Fallback encoder for values orjson doesn't handle natively."""
+    # DatetimeWithNanoseconds subclasses datetime, which orjson rejects
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(obj)).decode("ascii")
+    # PIL IFDRational and friends
+    if isinstance(obj, numbers.Integral):
+        return int(obj)
+    if isinstance(obj, numbers.Real):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    # GeoPoint
+    if hasattr(obj, "latitude") and hasattr(obj, "longitude"):
+        return {"latitude": obj.latitude, "longitude": obj.longitude}
+    # DocumentReference
+    if hasattr(obj, "path") and hasattr(obj, "id"):
+        return obj.path
+    return str(obj)
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=firestore_default, option=ORJSON_OPTIONS)
+
+
+class FirestoreJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,143 @@
+"""
+Local staging area for resumable (offset-based) uploads.
+
+Each upload gets a directory holding the partial file (`data`) and a
+`meta.json` with the owner, declared size, current offset and the SHA-256
+of every accepted chunk. Entries expire after UPLOAD_STAGING_TTL_SECONDS
+and the sum of declared sizes is capped at UPLOAD_STAGING_MAX_BYTES.
+"""
+import fcntl
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from app.config import settings
+
+
+class StagingFull(Exception):
+    pass
+
+
+class UploadStaging:
+    def __init__(self, root: str, ttl_seconds: int, max_bytes: int):
+        self.root = root
+        self.ttl = ttl_seconds
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def _dir(self, upload_id: str) -> str:
+        # ids are uuid4 hex; reject anything that could escape the root
+        if not upload_id.isalnum():
+            raise KeyError(upload_id)
+        return os.path.join(self.root, upload_id)
+
+    def data_path(self, upload_id: str) -> str:
+        return os.path.join(self._dir(upload_id), "data")
+
+    def _read_meta(self, upload_id: str) -> dict:
+        try:
+            with open(os.path.join(self._dir(upload_id), "meta.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise KeyError(upload_id)
+
+    def _write_meta(self, upload_id: str, meta: dict) -> None:
+        path = os.path.join(self._dir(upload_id), "meta.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, path)
+
+    def _entries(self):
+        for name in os.listdir(self.root):
+            try:
+                yield name, self._read_meta(name)
+            except (KeyError, ValueError):
+                continue
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        removed = 0
+        for upload_id, meta in list(self._entries()):
+            if meta.get("expires_at", 0) <= now:
+                self.remove(upload_id)
+                removed += 1
+        return removed
+
+    def reserved_bytes(self) -> int:
+        return sum(meta.get("size", 0) for _, meta in self._entries())
+
+    @contextmanager
+    def _root_locked(self):
+        # ".lock" is not a valid upload id, so _entries() skips it
+        fd = os.open(os.path.join(self.root, ".lock"), os.O_CREAT | os.O_RDWR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def create(self, uid: str, size: int, info: dict) -> dict:
+        # the quota check and the reservation must be atomic across workers
+        with self._root_locked():
+            self.purge_expired()
+            if self.reserved_bytes() + size > self.max_bytes:
+                raise StagingFull()
+            upload_id = uuid.uuid4().hex
+            os.makedirs(self._dir(upload_id))
+            open(self.data_path(upload_id), "wb").close()
+            meta = {
+                "id": upload_id,
+                "uid": uid,
+                "size": size,
+                "offset": 0,
+                "chunks": [],
+                "created_at": time.time(),
+                "expires_at": time.time() + self.ttl,
+                **info,
+            }
+            self._write_meta(upload_id, meta)
+        return meta
+
+    def get(self, upload_id: str) -> dict:
+        meta = self._read_meta(upload_id)
+        if meta.get("expires_at", 0) <= time.time():
+            self.remove(upload_id)
+            raise KeyError(upload_id)
+        return meta
+
+    @contextmanager
+    def locked(self, upload_id: str):
+        """Exclusive lock across workers while a chunk is being appended."""
+        lock_path = os.path.join(self._dir(upload_id), "lock")
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_RDWR)
+        except FileNotFoundError:
+            raise KeyError(upload_id)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield self.get(upload_id)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def commit_chunk(self, meta: dict, length: int, sha256: str) -> dict:
+        meta["chunks"].append({"offset": meta["offset"], "length": length, "sha256": sha256})
+        meta["offset"] += length
+        # activity keeps the entry alive
+        meta["expires_at"] = time.time() + self.ttl
+        self._write_meta(meta["id"], meta)
+        return meta
+
+    def remove(self, upload_id: str) -> None:
+        shutil.rmtree(self._dir(upload_id), ignore_errors=True)
+
+
+staging = UploadStaging(
+    settings.UPLOAD_STAGING_DIR,
+    settings.UPLOAD_STAGING_TTL_SECONDS,
+    settings.UPLOAD_STAGING_MAX_BYTES,
+)
@@ -0,0 +1,109 @@
+"""
+Payload size and serialization time for a 1,000-image listing, before and
+after the orjson response class / EXIF stripping / compression changes.
+
+Runs offline on synthetic documents shaped like Firestore returns them.
+
+    python -m benchmarks.bench_listing [n_images]
+"""
+import gzip
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from google.api_core.datetime_helpers import DatetimeWithNanoseconds
+from app.utils.compression import _Brotli, brotli
+from app.utils.exif import without_exif
+from app.utils.responses import FirestoreJSONResponse
+
+REPEAT = 20
+
+
+def make_doc(i: int, ascii_makernote: bool) -> dict:
+    rnd = random.Random(i)
+    note = bytes(rnd.getrandbits(8) for _ in range(6000))
+    if ascii_makernote:
+        # the old encoder only survives MakerNotes that happen to be valid UTF-8
+        note = bytes(b & 0x7F for b in note)
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=i)
+    ts = DatetimeWithNanoseconds(*base.timetuple()[:6], nanosecond=123456789, tzinfo=timezone.utc)
+    return {
+        "public_id": f"sunian-photos/uid{i % 7}/IMG_{i:05d}_abc123",
+        "url": f"https://res.cloudinary.com/demo/image/upload/v1700000000/sunian-photos/uid{i % 7}/IMG_{i:05d}.jpg",
+        "filename": f"IMG_{i:05d}.jpg",
+        "mime_type": "image/jpeg",
+        "width": 6000,
+        "height": 4000,
+        "size_bytes": 8_000_000 + i,
+        "title": f"Photo {i}",
+        "caption": "",
+        "alt_text": "",
+        "license": "CC-BY",
+        "privacy": "public",
+        "uploaded_by": f"uid{i % 7}",
+        "uploaded_at": ts,
+        "camera_model": "canon eos r5",
+        "album_id": f"album{i % 12}",
+        "tags": ["travel", "street"],
+        "exif": {
+            "Make": "Canon",
+            "Model": "Canon EOS R5",
+            "ExposureTime": 0.004,
+            "FNumber": 2.8,
+            "ISOSpeedRatings": 400,
+            "FocalLength": 35.0,
+            "DateTimeOriginal": ts.strftime("%Y:%m:%d %H:%M:%S"),
+            "MakerNote": note,
+            "GPSInfo": {"GPSLatitude": [37.0, 46.0, 30.0], "GPSLatitudeRef": "N"},
+        },
+    }
+
+
+def timed(fn) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        fn()
+    return (time.perf_counter() - start) / REPEAT * 1000
+
+
+def before(docs):
+    # old path: dict returned from the route -> jsonable_encoder -> JSONResponse
+    return JSONResponse(jsonable_encoder({"count": len(docs), "images": docs})).body
+
+
+def after(docs):
+    stripped = [without_exif(dict(d)) for d in docs]
+    return FirestoreJSONResponse({"count": len(stripped), "images": stripped}).body
+
+
+def main(n: int) -> None:
+    binary_docs = [make_doc(i, ascii_makernote=False) for i in range(n)]
+    ascii_docs = [make_doc(i, ascii_makernote=True) for i in range(n)]
+
+    try:
+        before(binary_docs)
+        binary_result = "ok"
+    except UnicodeDecodeError as e:
+        binary_result = f"fails ({type(e).__name__})"
+
+    old_body = before(ascii_docs)
+    new_body = after(binary_docs)
+    rows = [
+        ("before (default encoder, exif included)", len(old_body), timed(lambda: before(ascii_docs))),
+        ("after  (orjson, exif stripped)", len(new_body), timed(lambda: after(binary_docs))),
+    ]
+
+    print(f"{n} images; default encoder on binary MakerNote: {binary_result}")
+    print(f"{'':42} {'bytes':>10} {'gzip':>10} {'br':>10} {'ms':>8}")
+    for label, body_len, ms in rows:
+        body = old_body if label.startswith("before") else new_body
+        gz = len(gzip.compress(body, 6))
+        br = len(_Brotli(4).compress(body, final=True)) if brotli is not None else None
+        print(f"{label:42} {body_len:>10} {gz:>10} {br if br is not None else '-':>10} {ms:>8.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
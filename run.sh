@@ -3,6 +3,8 @@
 if [ "$1" = "dev" ]; then
   uvicorn app.main:app --reload --host 0.0.0.0 --port 8000
 else
-  # production: multiple workers recommended (adjust worker count)
-  uvicorn app.main:app --host 0.0.0.0 --port 8000 --workers 2
+  # production: multiple workers recommended (adjust worker count).
+  # WEB_CONCURRENCY is exported so the app knows to share SSE events across workers.
+  export WEB_CONCURRENCY="${WEB_CONCURRENCY:-2}"
+  uvicorn app.main:app --host 0.0.0.0 --port 8000 --workers "$WEB_CONCURRENCY"
 fi
\ No newline at end of file
@@ -0,0 +1,94 @@
+"""
+Offline stand-in for Cloudinary. Patches the SDK calls the app makes
+(uploader.upload/upload_large/destroy, api.resource) and simulates the
+browser's signed direct upload, checking the signature the way
+Cloudinary does.
+"""
+import time
+import uuid
+from datetime import datetime, timezone
+import cloudinary
+import cloudinary.api
+import cloudinary.exceptions
+import cloudinary.uploader
+import cloudinary.utils
+
+# parameters Cloudinary leaves out of the upload signature
+_UNSIGNED = {"file", "api_key", "signature", "resource_type", "cloud_name"}
+
+
+class CloudinaryStub:
+    def __init__(self):
+        self.assets = {}
+
+    def install(self, monkeypatch):
+        monkeypatch.setattr(cloudinary.uploader, "upload", self.upload)
+        monkeypatch.setattr(cloudinary.uploader, "upload_large", self.upload)
+        monkeypatch.setattr(cloudinary.uploader, "destroy", self.destroy)
+        monkeypatch.setattr(cloudinary.api, "resource", self.resource)
+        return self
+
+    def _store(self, public_id, data, image_metadata=None, fmt="jpg"):
+        previous = self.assets.get(public_id)
+        version = int(time.time())
+        if previous and previous["version"] >= version:
+            version = previous["version"] + 1
+        url = cloudinary.utils.cloudinary_url(public_id, version=version, format=fmt, secure=True)[0]
+        self.assets[public_id] = {
+            "public_id": public_id,
+            "version": version,
+            "format": fmt,
+            "resource_type": "image",
+            "type": "upload",
+            "created_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "bytes": len(data),
+            "width": 640,
+            "height": 480,
+            "url": url.replace("https://", "http://", 1),
+            "secure_url": url,
+            "image_metadata": dict(image_metadata or {}),
+        }
+        return self.assets[public_id]
+
+    def _response(self, asset):
+        signature = cloudinary.utils.api_sign_request(
+            {"public_id": asset["public_id"], "version": asset["version"]},
+            cloudinary.config().api_secret,
+        )
+        return {**asset, "signature": signature}
+
+    # --- SDK replacements ---
+
+    def upload(self, file, public_id=None, folder=None, **options):
+        data = file.read() if hasattr(file, "read") else open(file, "rb").read()
+        public_id = public_id or uuid.uuid4().hex
+        if folder:
+            public_id = f"{folder}/{public_id}"
+        return self._response(self._store(public_id, data))
+
+    def destroy(self, public_id, **options):
+        return {"result": "ok" if self.assets.pop(public_id, None) else "not found"}
+
+    def resource(self, public_id, **options):
+        asset = self.assets.get(public_id)
+        if asset is None:
+            raise cloudinary.exceptions.NotFound(f"Resource not found - {public_id}")
+        asset = dict(asset)
+        if not options.get("image_metadata"):
+            asset.pop("image_metadata")
+        return asset
+
+    # --- what the browser does with the output of /photos/sign ---
+
+    def direct_upload(self, signed: dict, data: bytes, filename="photo.jpg", image_metadata=None):
+        params = {k: v for k, v in signed.items() if k not in _UNSIGNED and k != "upload_url"}
+        expected = cloudinary.utils.api_sign_request(params, cloudinary.config().api_secret)
+        if signed.get("signature") != expected:
+            raise cloudinary.exceptions.AuthorizationRequired("Invalid Signature")
+        if signed.get("api_key") != cloudinary.config().api_key:
+            raise cloudinary.exceptions.AuthorizationRequired("Invalid API key")
+        if time.time() - int(signed["timestamp"]) > 3600:
+            raise cloudinary.exceptions.AuthorizationRequired("Stale request")
+        stem, _, ext = filename.rpartition(".")
+        public_id = f"{signed['folder']}/{stem}_{uuid.uuid4().hex[:6]}"
+        return self._response(self._store(public_id, data, image_metadata, ext or "jpg"))
@@ -0,0 +1,68 @@
+"""
+Test setup: settings point at throwaway paths, and app.utils.firebase_auth
+is replaced by an in-memory Firestore so no Google credentials are needed.
+"""
+import os
+import sys
+import tempfile
+import types
+
+_tmp = tempfile.mkdtemp(prefix="sunian-tests-")
+os.environ.update({
+    "CLOUDINARY_CLOUD_NAME": "demo",
+    "CLOUDINARY_API_KEY": "test-key",
+    "CLOUDINARY_API_SECRET": "test-secret",
+    "JOBS_DB_PATH": os.path.join(_tmp, "media.db"),
+    "FEATURES_PATH": os.path.join(_tmp, "features.f32"),
+    "UPLOAD_STAGING_DIR": os.path.join(_tmp, "staging"),
+})
+
+from fastapi import HTTPException  # noqa: E402
+from fastapi.security import HTTPBearer  # noqa: E402
+from app.utils.current_user import CurrentUser  # noqa: E402
+from tests.fake_firestore import FakeFirestore  # noqa: E402
+
+fake_db = FakeFirestore()
+
+
+def verify_firebase_token():
+    # tests override this dependency with a concrete user
+    raise HTTPException(status_code=401, detail="Invalid or expired token")
+
+
+firebase_auth = types.ModuleType("app.utils.firebase_auth")
+firebase_auth.db = fake_db
+firebase_auth.CurrentUser = CurrentUser
+firebase_auth.verify_firebase_token = verify_firebase_token
+firebase_auth.security = HTTPBearer()
+sys.modules["app.utils.firebase_auth"] = firebase_auth
+
+import pytest  # noqa: E402
+from tests.cloudinary_stub import CloudinaryStub  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    fake_db.store.clear()
+    return fake_db
+
+
+@pytest.fixture
+def cloudinary_stub(monkeypatch):
+    return CloudinaryStub().install(monkeypatch)
+
+
+def load_main():
+    """Import app.main with Firebase Admin pointed at the in-memory fake."""
+    if "app.main" in sys.modules:
+        return sys.modules["app.main"]
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    from app.config import Settings
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(firebase_admin, "initialize_app", lambda *args, **kwargs: None)
+        mp.setattr(credentials, "Certificate", lambda *args, **kwargs: None)
+        mp.setattr(firestore, "client", lambda *args, **kwargs: fake_db)
+        mp.setattr(Settings, "credentials_data", None, raising=False)
+        import app.main
+    return app.main
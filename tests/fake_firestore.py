@@ -0,0 +1,249 @@
+"""
+Minimal in-memory stand-in for the Firestore client, covering the calls the
+app makes: documents, simple where/order_by/limit queries, batches with
+Increment, get_all and transactions.
+"""
+import copy
+import itertools
+from datetime import datetime, timezone
+from google.cloud.firestore import Increment
+
+_OPS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "in": lambda a, b: a in b,
+    "array_contains": lambda a, b: b in (a or []),
+}
+
+
+def _utc(value):
+    # the client sends naive datetimes as UTC timestamps
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _apply(current, data):
+    out = dict(current or {})
+    for key, value in data.items():
+        if isinstance(value, Increment):
+            value = (out.get(key) or 0) + value.value
+        out[key] = copy.deepcopy(value)
+    return out
+
+
+class FakeSnapshot:
+    def __init__(self, ref, data):
+        self.reference = ref
+        self.id = ref.id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+
+def _split(path):
+    parts = [p for p in path.split("/") if p] if path else []
+    if not parts:
+        raise ValueError(f"empty path segment in {path!r}")
+    return parts
+
+
+class FakeDocumentRef:
+    """
+    Like the real client, a "/" in a document id is a path: "a/b/c" under
+    `images` is images/a/b/c, i.e. doc "c" of subcollection "b" of doc "a".
+    """
+
+    def __init__(self, store, collection, doc_id):
+        self._store = store
+        self._collection = collection
+        self.id = doc_id
+
+    @property
+    def path(self):
+        return f"{self._collection}/{self.id}"
+
+    @property
+    def _docs(self):
+        return self._store.setdefault(self._collection, {})
+
+    def collection(self, name):
+        return FakeCollection(self._store, f"{self.path}/{name}")
+
+    def collections(self):
+        prefix = self.path + "/"
+        names = {
+            path[len(prefix):] for path, docs in self._store.items()
+            if docs and path.startswith(prefix) and "/" not in path[len(prefix):]
+        }
+        return [self.collection(name) for name in sorted(names)]
+
+    def get(self, transaction=None):
+        return FakeSnapshot(self, copy.deepcopy(self._docs.get(self.id)))
+
+    def set(self, data, merge=False):
+        self._docs[self.id] = _apply(self._docs.get(self.id) if merge else None, data)
+
+    def create(self, data):
+        from google.api_core.exceptions import AlreadyExists
+        if self.id in self._docs:
+            raise AlreadyExists(self.path)
+        self.set(data)
+
+    def update(self, data):
+        from google.api_core.exceptions import NotFound
+        if self.id not in self._docs:
+            raise NotFound(self.path)
+        self.set(data, merge=True)
+
+    def delete(self):
+        self._docs.pop(self.id, None)
+
+
+class FakeQuery:
+    def __init__(self, store, collection, filters=(), order=(), limit=None):
+        self._store = store
+        self._collection = collection
+        self._filters = list(filters)
+        self._order = list(order)
+        self._limit = limit
+
+    def _copy(self, **kw):
+        args = dict(filters=self._filters, order=self._order, limit=self._limit)
+        args.update(kw)
+        return FakeQuery(self._store, self._collection, **args)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + [(field_path, op_string, value)])
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(order=self._order + [(field_path, direction)])
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def select(self, fields):
+        return self
+
+    def start_after(self, snapshot):
+        return self._copy(filters=self._filters + [("__after__", None, snapshot)])
+
+    def stream(self, transaction=None):
+        docs = self._store.setdefault(self._collection, {})
+        rows = sorted(docs.items())
+        after = None
+        for field, op, value in self._filters:
+            if field == "__after__":
+                after = value
+                continue
+            # like Firestore, a filter never matches a document missing the field
+            rows = [(k, v) for k, v in rows if field in v and _OPS[op](_utc(v.get(field)), _utc(value))]
+        for field, direction in reversed(self._order):
+            if field == "__name__":
+                key = lambda kv: kv[0]  # noqa: E731
+            else:
+                rows = [(k, v) for k, v in rows if field in v]
+                key = lambda kv, f=field: kv[1].get(f)  # noqa: E731
+            rows.sort(key=key, reverse=str(direction).upper().endswith("DESCENDING"))
+        if after is not None:
+            ids = [k for k, _ in rows]
+            rows = rows[ids.index(after.id) + 1:] if after.id in ids else rows
+        if self._limit is not None:
+            rows = rows[: self._limit]
+        for doc_id, data in rows:
+            ref = FakeDocumentRef(self._store, self._collection, doc_id)
+            yield FakeSnapshot(ref, copy.deepcopy(data))
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, store, path):
+        if len(_split(path)) % 2 != 1:
+            raise ValueError(f"{path!r} is not a collection path")
+        super().__init__(store, "/".join(_split(path)))
+        self.id = _split(path)[-1]
+        self._ids = itertools.count(1)
+
+    def document(self, doc_path=None):
+        if doc_path is None:
+            return FakeDocumentRef(self._store, self._collection, f"auto-{next(self._ids)}")
+        parts = _split(doc_path)
+        if len(parts) % 2 != 1:
+            raise ValueError(f"{self._collection}/{doc_path} is not a document path")
+        collection = "/".join([self._collection, *parts[:-1]])
+        return FakeDocumentRef(self._store, collection, parts[-1])
+
+
+class FakeBatch:
+    def __init__(self):
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append(lambda: ref.set(data, merge=merge))
+
+    def update(self, ref, data):
+        self._ops.append(lambda: ref.update(data))
+
+    def delete(self, ref):
+        self._ops.append(ref.delete)
+
+    def commit(self):
+        for op in self._ops:
+            op()
+        self._ops = []
+
+
+class FakeTransaction(FakeBatch):
+    """
+    Enough of Transaction for @firestore.transactional: one attempt,
+    writes buffered until commit and dropped on rollback.
+    """
+    _id = b"fake-transaction"
+    _read_only = False
+    _max_attempts = 1
+
+    def create(self, ref, data):
+        self._ops.append(lambda: ref.create(data))
+
+    def _clean_up(self):
+        self._ops = []
+
+    def _begin(self, retry_id=None):
+        pass
+
+    def _commit(self):
+        self.commit()
+
+    def _rollback(self):
+        self._ops = []
+
+
+class FakeFirestore:
+    def __init__(self):
+        # "collection/path" -> {doc id: data}
+        self.store = {}
+
+    def collection(self, path):
+        return FakeCollection(self.store, path)
+
+    def batch(self):
+        return FakeBatch()
+
+    def transaction(self, **kwargs):
+        return FakeTransaction()
+
+    def get_all(self, refs):
+        return [ref.get() for ref in refs]
@@ -0,0 +1,125 @@
+import json
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.routes import images
+from app.utils.current_user import CurrentUser
+from app.utils.firebase_auth import verify_firebase_token
+from app.utils.jobs import jobs
+from tests.conftest import load_main
+
+ALICE = CurrentUser(uid="alice", email="alice@example.com", role="visitor")
+BOB = CurrentUser(uid="bob", email="bob@example.com", role="visitor")
+
+
+@pytest.fixture
+def as_user(db, cloudinary_stub):
+    app = FastAPI()
+    app.include_router(images.router, prefix="/api/images")
+
+    def login(user):
+        app.dependency_overrides[verify_firebase_token] = lambda: user
+        return TestClient(app)
+
+    return login
+
+
+def _upload(client, stub, **kwargs):
+    signed = client.post("/api/images/photos/sign").json()
+    return stub.direct_upload(signed, b"\xff\xd8fake-jpeg", **kwargs)
+
+
+def test_sign_then_finalize(as_user, cloudinary_stub, db):
+    client = as_user(ALICE)
+    uploaded = _upload(
+        client, cloudinary_stub, filename="beach.jpg",
+        image_metadata={"Model": "Canon EOS R5", "DateTimeOriginal": "2024:07:01 10:00:00"},
+    )
+    assert uploaded["public_id"].startswith("sunian-photos/alice/beach_")
+
+    resp = client.post("/api/images/photos/finalize", json={
+        "public_id": uploaded["public_id"],
+        "version": uploaded["version"],
+        "signature": uploaded["signature"],
+        "title": "Beach",
+    })
+    assert resp.status_code == 200, resp.text
+
+    image_id = resp.json()["id"]
+    assert "/" not in image_id
+    # stored flat in `images`, where search/export/facets can see it
+    stored = {doc.id: doc.to_dict() for doc in db.collection("images").stream()}
+    assert list(stored) == [image_id]
+    rec = stored[image_id]
+    assert rec["public_id"] == uploaded["public_id"]
+    assert rec["url"] == uploaded["secure_url"]
+    assert rec["size_bytes"] == uploaded["bytes"]
+    assert rec["filename"].endswith(".jpg")
+    assert rec["camera_model"] == "canon eos r5"
+    assert rec["title"] == "Beach"
+    assert rec["uploaded_by"] == "alice"
+
+    # a retried finalize returns the stored document
+    again = client.post("/api/images/photos/finalize", json={
+        "public_id": uploaded["public_id"],
+        "version": uploaded["version"],
+        "signature": uploaded["signature"],
+    })
+    assert again.json() == resp.json()
+
+
+def test_finalize_rejects_tampering(as_user, cloudinary_stub, db):
+    client = as_user(ALICE)
+    uploaded = _upload(client, cloudinary_stub)
+    body = {k: uploaded[k] for k in ("public_id", "version", "signature")}
+
+    # asset fields come from Cloudinary, never from the client
+    forged = client.post("/api/images/photos/finalize", json={**body, "secure_url": "https://evil.example/x.jpg"})
+    assert forged.status_code == 422
+
+    bad_sig = client.post("/api/images/photos/finalize", json={**body, "signature": "0" * 40})
+    assert bad_sig.status_code == 400
+
+    bad_version = client.post("/api/images/photos/finalize", json={**body, "version": body["version"] + 1})
+    assert bad_version.status_code == 400
+
+    # a valid tuple for someone else's folder
+    assert as_user(BOB).post("/api/images/photos/finalize", json=body).status_code == 403
+    assert not db.store.get("images")
+
+
+def _run_queued(job_type):
+    while True:
+        job = jobs._claim(job_type)
+        if job is None:
+            return
+        jobs.handlers[job_type].func(json.loads(job["payload"]))
+        jobs._finish(job, None)
+
+
+def test_finalize_replay_after_delete(cloudinary_stub, db):
+    # through the real app, so the delete is whichever handler actually serves it
+    main = load_main()
+    main.app.dependency_overrides[verify_firebase_token] = lambda: ALICE
+    try:
+        client = TestClient(main.app)
+        uploaded = _upload(client, cloudinary_stub)
+        body = {k: uploaded[k] for k in ("public_id", "version", "signature")}
+        image_id = client.post("/api/images/photos/finalize", json=body).json()["id"]
+
+        assert client.delete(f"/api/images/{image_id}").status_code == 200
+        _run_queued("destroy_cloudinary_asset")
+        assert uploaded["public_id"] not in cloudinary_stub.assets
+
+        assert client.post("/api/images/photos/finalize", json=body).status_code == 404
+        assert not db.collection("images").document(image_id).get().exists
+    finally:
+        main.app.dependency_overrides.clear()
+
+
+def test_finalize_rejects_stale_upload(as_user, cloudinary_stub, db):
+    client = as_user(ALICE)
+    uploaded = _upload(client, cloudinary_stub)
+    cloudinary_stub.assets[uploaded["public_id"]]["created_at"] = "2020-01-01T00:00:00Z"
+    body = {k: uploaded[k] for k in ("public_id", "version", "signature")}
+    assert client.post("/api/images/photos/finalize", json=body).status_code == 410
@@ -0,0 +1,19 @@
+import asyncio
+from app.utils.events import SQLiteBroker
+
+
+def test_sqlite_broker_crosses_processes(tmp_path):
+    # two brokers on one database stand in for two uvicorn workers
+    path = str(tmp_path / "media.db")
+    worker_a = SQLiteBroker(path, poll_seconds=0.01)
+    worker_b = SQLiteBroker(path, poll_seconds=0.01)
+
+    async def scenario():
+        sub = worker_b.subscribe(["image:1"])
+        worker_a.publish("image:2", {"type": "comment", "image_id": "2"})
+        worker_a.publish("image:1", {"type": "likes", "image_id": "1", "total_likes": 3})
+        event = await sub.get(timeout=2)
+        worker_b.unsubscribe(sub)
+        return event
+
+    assert asyncio.run(scenario()) == {"type": "likes", "image_id": "1", "total_likes": 3}
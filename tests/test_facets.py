@@ -0,0 +1,73 @@
+import io
+from fastapi.testclient import TestClient
+from PIL import Image
+from app.utils.current_user import CurrentUser
+from app.utils.facets import get_facet_counts, rebuild_facets, record_facet_change
+from tests.conftest import load_main
+
+
+def _image(**fields):
+    return {"privacy": "public", "album_id": None, "license": "", "camera_model": "canon eos r5", **fields}
+
+
+def test_deltas_follow_edits(db):
+    rec = _image(album_id="trips")
+    record_facet_change(None, rec)
+    assert get_facet_counts()["album_id"] == {"trips": 1}
+
+    # album reassignment moves the count
+    moved = {**rec, "album_id": "family"}
+    record_facet_change(rec, moved)
+    assert get_facet_counts()["album_id"] == {"family": 1}
+
+    # removing the album drops it; None is never a facet value
+    no_album = {**moved, "album_id": None}
+    record_facet_change(moved, no_album)
+    assert get_facet_counts()["album_id"] == {}
+    assert get_facet_counts()["camera_model"] == {"canon eos r5": 1}
+
+    # private images are not counted, in either direction of the flip
+    private = {**no_album, "privacy": "private", "album_id": "trips"}
+    record_facet_change(no_album, private)
+    assert get_facet_counts() == {"album_id": {}, "license": {}, "camera_model": {}}
+    record_facet_change(private, {**private, "privacy": "public"})
+    assert get_facet_counts()["album_id"] == {"trips": 1}
+
+    record_facet_change({**private, "privacy": "public"}, None)
+    assert get_facet_counts() == {"album_id": {}, "license": {}, "camera_model": {}}
+
+
+def test_incremental_counts_match_rebuild(db):
+    recs = {
+        "a": _image(album_id="trips"),
+        "b": _image(album_id="trips", privacy="private"),
+        "c": {"camera_model": "nikon z6"},  # legacy doc without privacy counts as public
+    }
+    for image_id, rec in recs.items():
+        db.collection("images").document(image_id).set(rec)
+        record_facet_change(None, rec)
+    incremental = get_facet_counts()
+    assert rebuild_facets() == incremental
+    assert get_facet_counts() == incremental
+
+
+def _jpeg_with_model(model):
+    exif = Image.Exif()
+    exif[0x0110] = model  # Model
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(buf, "JPEG", exif=exif)
+    buf.seek(0)
+    return buf
+
+
+def test_legacy_upload_counts_facets(db, cloudinary_stub):
+    main = load_main()
+    main.app.dependency_overrides[main.get_current_user] = lambda: CurrentUser("admin", None, "admin")
+    try:
+        client = TestClient(main.app)
+        resp = client.post("/api/upload", files={"file": ("a.jpg", _jpeg_with_model("Canon EOS R5"), "image/jpeg")})
+        assert resp.status_code == 200, resp.text
+    finally:
+        main.app.dependency_overrides.clear()
+    assert get_facet_counts()["camera_model"] == {"canon eos r5": 1}
+    assert get_facet_counts() == rebuild_facets()
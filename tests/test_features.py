@@ -0,0 +1,64 @@
+import numpy as np
+from app.utils import features
+from app.utils.features import FeatureIndex, backfill, cloudinary_public_id
+
+
+def test_cloudinary_public_id():
+    assert cloudinary_public_id("sunian-photos/u/a_1", {"public_id": "sunian-photos/u/a_1"}) == "sunian-photos/u/a_1"
+    # /api/upload documents: doc id is the bare uuid, the asset lives in the album folder
+    url = "https://res.cloudinary.com/demo/image/upload/v1712345678/v2/abc-123.jpg"
+    assert cloudinary_public_id("abc-123", {"url": url}) == "v2/abc-123"
+    assert cloudinary_public_id("abc-123", {}) == "abc-123"
+
+
+def test_backfill_uses_stored_public_id(db, tmp_path, monkeypatch):
+    index = FeatureIndex(str(tmp_path / "features.f32"))
+    monkeypatch.setattr(features, "feature_index", index)
+    fetched = []
+
+    def fake_fetch(public_id):
+        fetched.append(public_id)
+        return np.ones(features.DIM, dtype=np.float32)
+
+    monkeypatch.setattr(features, "fetch_features", fake_fetch)
+    db.collection("images").document("abc-123").set({"public_id": "holidays/abc-123"})
+    db.collection("images").document("5f0c").set({"public_id": "sunian-photos/u/x"})
+
+    assert backfill(workers=1) == 2
+    assert sorted(fetched) == ["holidays/abc-123", "sunian-photos/u/x"]
+    assert "abc-123" in index and "5f0c" in index
+
+
+def test_compact_drops_dead_and_superseded_rows(tmp_path):
+    index = FeatureIndex(str(tmp_path / "features.f32"))
+    reader = FeatureIndex(str(tmp_path / "features.f32"))  # another worker
+    vec = lambda x: np.full(features.DIM, x, dtype=np.float32)
+    index.add("a", vec(1))
+    index.add("b", vec(2))
+    index.add("a", vec(3))  # supersedes row 0
+    index.add("c", vec(4))
+    index.remove("c")
+    assert reader.vector("b")[0] == 2
+
+    assert index.compact() == 2
+    assert open(index.ids_path).read().split() == ["b", "a"]
+    assert index.vector("a")[0] == 3 and index.vector("b")[0] == 2
+    assert "c" not in index
+    # the other worker re-maps onto the rewritten files
+    assert reader.vector("a")[0] == 3 and "c" not in reader
+    assert reader.top_k(vec(1), 5)[0][0][0] in {"a", "b"}
+
+    assert index.compact(keep={"a"}) == 1
+    assert "b" not in index and index.vector("a")[0] == 3
+    assert index.compact() == 0
+
+
+def test_backfill_force_compacts_deleted_images(db, tmp_path, monkeypatch):
+    index = FeatureIndex(str(tmp_path / "features.f32"))
+    monkeypatch.setattr(features, "feature_index", index)
+    monkeypatch.setattr(features, "fetch_features", lambda public_id: np.ones(features.DIM, dtype=np.float32))
+    index.add("gone", np.ones(features.DIM, dtype=np.float32))
+    db.collection("images").document("kept").set({"public_id": "x/kept"})
+
+    assert backfill(force=True, workers=1) == 1
+    assert open(index.ids_path).read().split() == ["kept"]
@@ -0,0 +1,91 @@
+from app.routes import search
+from app.schemas import GeoSearchQuery
+from app.utils import geo
+
+
+def test_gps_from_cloudinary_metadata():
+    # flat ExifTool strings, as returned by Cloudinary with image_metadata=true
+    meta = {
+        "GPSLatitude": "37 deg 46' 30.00\" N",
+        "GPSLongitude": "122 deg 25' 9.60\" W",
+        "GPSLatitudeRef": "North",
+        "GPSLongitudeRef": "West",
+    }
+    lat, lon = geo.gps_from_exif(meta)
+    assert round(lat, 4) == 37.775 and round(lon, 4) == -122.4193
+    assert geo.location_fields(meta)["geohash"] == geo.encode(lat, lon)
+
+    pil = {"GPSInfo": {"GPSLatitude": [37.0, 46.0, 30.0], "GPSLatitudeRef": "N",
+                       "GPSLongitude": [122.0, 25.0, 9.6], "GPSLongitudeRef": "W"}}
+    assert geo.gps_from_exif(pil) == (lat, lon)
+    assert geo.gps_from_exif({"Model": "x"}) is None
+
+
+def _image(db, doc_id, lat, lon, privacy="public"):
+    db.collection("images").document(doc_id).set(
+        {"public_id": doc_id, "privacy": privacy, **geo.location_fields(
+            {"GPSInfo": {"GPSLatitude": lat, "GPSLatitudeRef": "N", "GPSLongitude": lon, "GPSLongitudeRef": "E"}}
+        )}
+    )
+
+
+def test_geo_search_pages_past_rejected_candidates(db, monkeypatch):
+    monkeypatch.setattr(search, "GEO_PAGE_SIZE", 3)
+    box = dict(min_lat=10.0, min_lon=10.0, max_lat=10.5, max_lon=10.5)
+    cells = geo.covering_cells(10.0, 10.0, 10.5, 10.5, max_cells=search.GEO_MAX_CELLS)
+    # candidates that share a cell but fall outside the box sort first
+    cell_lat, cell_lon, _, _ = geo.decode_bounds(cells[0])
+    for i in range(10):
+        _image(db, f"outside-{i}", cell_lat + 0.001 * i, cell_lon + 0.001)
+    for i in range(4):
+        _image(db, f"inside-{i}", 10.01, 10.1 + 0.01 * i)
+    _image(db, "private", 10.01, 10.05, privacy="private")
+
+    body = search.geo_search(GeoSearchQuery(**box, limit=3)).body
+    assert body.count(b'"inside-') == 3
+
+    body = search.geo_search(GeoSearchQuery(**box, limit=50)).body
+    assert body.count(b'"inside-') == 4 and b"private" not in body
+
+
+def _jpeg_with_gps(lat, lon):
+    import io
+    from PIL import Image
+    exif = Image.Exif()
+    exif[0x8825] = {1: "N", 2: (float(lat), 0.0, 0.0), 3: "E", 4: (float(lon), 0.0, 0.0)}
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(buf, "JPEG", exif=exif)
+    buf.seek(0)
+    return buf
+
+
+def test_legacy_upload_is_on_the_map(db, cloudinary_stub):
+    from fastapi.testclient import TestClient
+    from app.utils.current_user import CurrentUser
+    from tests.conftest import load_main
+
+    main = load_main()
+    main.app.dependency_overrides[main.get_current_user] = lambda: CurrentUser("admin", None, "admin")
+    try:
+        resp = TestClient(main.app).post(
+            "/api/upload", files={"file": ("a.jpg", _jpeg_with_gps(48, 2), "image/jpeg")}
+        )
+        assert resp.status_code == 200, resp.text
+    finally:
+        main.app.dependency_overrides.clear()
+
+    body = search.geo_search(GeoSearchQuery(lat=48, lon=2, radius_km=5)).body
+    assert resp.json()["id"].encode() in body
+
+
+def test_migration_backfills_privacy(db):
+    from app.utils.migrations import normalize_image_documents
+
+    db.collection("images").document("legacy").set(
+        {"id": "legacy", "uploaded_at": "2023-05-01T10:00:00Z", "exif": {"GPSInfo": {
+            "GPSLatitude": 48.0, "GPSLatitudeRef": "N", "GPSLongitude": 2.0, "GPSLongitudeRef": "E"}}}
+    )
+    assert b"legacy" not in search.geo_search(GeoSearchQuery(lat=48, lon=2, radius_km=5)).body
+    assert normalize_image_documents() == 1
+    assert db.collection("images").document("legacy").get().to_dict()["privacy"] == "public"
+    assert b"legacy" in search.geo_search(GeoSearchQuery(lat=48, lon=2, radius_km=5)).body
@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from fastapi import HTTPException
+from app.utils.idempotency import IdempotencyStore, PENDING_TIMEOUT
+
+
+def test_replay_and_conflicts(db):
+    store = IdempotencyStore(db)
+    assert store.begin("uid:alice", "k1", "sha-a") is None
+
+    with pytest.raises(HTTPException) as running:
+        store.begin("uid:alice", "k1", "sha-a")
+    assert running.value.status_code == 409
+
+    store.finish("uid:alice", "k1", {"id": "img-1"})
+    assert store.begin("uid:alice", "k1", "sha-a") == {"id": "img-1"}
+
+    with pytest.raises(HTTPException) as reused:
+        store.begin("uid:alice", "k1", "sha-b")
+    assert reused.value.status_code == 422
+
+    # keys are scoped per caller
+    assert store.begin("uid:bob", "k1", "sha-b") is None
+
+
+def test_stale_reservation_is_reclaimed(db):
+    store = IdempotencyStore(db)
+    assert store.begin("uid:alice", "k1", "sha-a") is None
+    ref = store._ref("uid:alice", "k1")
+    ref.update({"started_at": datetime.now(timezone.utc) - PENDING_TIMEOUT - timedelta(seconds=1)})
+
+    assert store.begin("uid:alice", "k1", "sha-a") is None
+    rec = ref.get().to_dict()
+    assert rec["status"] == "pending"
+    assert rec["started_at"] > datetime.now(timezone.utc) - timedelta(minutes=1)
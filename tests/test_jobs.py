@@ -0,0 +1,89 @@
+import asyncio
+import time
+from app.config import settings
+from app.utils.jobs import JobQueue
+
+
+def _row(queue, job_id):
+    with queue._connect() as conn:
+        return dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+def test_lease_renewed_and_released_on_stop(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_LEASE_SECONDS", 0.3)
+    queue = JobQueue(str(tmp_path / "media.db"))
+    other = JobQueue(str(tmp_path / "media.db"))
+    assert queue.worker_id != other.worker_id
+
+    started = asyncio.Event()
+
+    @queue.handler("slow")
+    async def slow(payload):
+        started.set()
+        await asyncio.sleep(60)
+
+    async def scenario():
+        job_id = queue.enqueue("slow", {})
+        await queue.start()
+        await asyncio.wait_for(started.wait(), 5)
+        await asyncio.sleep(0.5)
+        # the handler outlived its lease but kept renewing it
+        row = _row(queue, job_id)
+        assert row["status"] == "running" and row["locked_by"] == queue.worker_id
+        assert time.time() - row["updated_at"] < 0.3
+        assert other.recover() == 0
+
+        await queue.stop()
+        return job_id
+
+    job_id = asyncio.run(scenario())
+    row = _row(queue, job_id)
+    assert (row["status"], row["locked_by"], row["attempts"]) == ("queued", None, 0)
+
+
+def test_worker_survives_queue_errors(tmp_path, monkeypatch):
+    import sqlite3
+    from app.utils import jobs as jobs_module
+
+    monkeypatch.setattr(jobs_module, "_db_backoff", lambda failures: 0.01)
+    queue = JobQueue(str(tmp_path / "media.db"))
+    done = asyncio.Event()
+
+    @queue.handler("quick")
+    async def quick(payload):
+        done.set()
+
+    claim = queue._claim
+    calls = []
+
+    def flaky_claim(job_type):
+        calls.append(job_type)
+        if len(calls) <= 2:
+            raise sqlite3.OperationalError("database is locked")
+        return claim(job_type)
+
+    monkeypatch.setattr(queue, "_claim", flaky_claim)
+
+    async def scenario():
+        job_id = queue.enqueue("quick", {})
+        await queue.start()
+        await asyncio.wait_for(done.wait(), 5)
+        await asyncio.sleep(0.05)
+        await queue.stop()
+        return job_id
+
+    assert _row(queue, asyncio.run(scenario()))["status"] == "done"
+
+
+def test_finish_only_touches_own_rows(tmp_path):
+    queue = JobQueue(str(tmp_path / "media.db"))
+    other = JobQueue(str(tmp_path / "media.db"))
+    queue.enqueue("x", {})
+    job = queue._claim("x")
+    # lease expired and another worker took the job over
+    with queue._connect() as conn:
+        conn.execute("UPDATE jobs SET locked_by = ? WHERE id = ?", (other.worker_id, job["id"]))
+    assert queue._finish(job, None) is False
+    assert _row(queue, job["id"])["status"] == "running"
+    assert other._finish(job, None) is True
+    assert _row(queue, job["id"])["status"] == "done"
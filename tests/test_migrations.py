@@ -0,0 +1,22 @@
+from app.routes.images import image_doc_id
+from app.utils.migrations import move_nested_image_documents
+
+
+def test_move_nested_image_documents(db):
+    public_id = "sunian-photos/alice/beach_ab12"
+    # what document(public_id).set() used to produce: a subcollection path
+    nested = db.collection("images").document(public_id)
+    nested.set({"public_id": public_id, "privacy": "public"})
+    nested.collection("comments").document("c1").set({"content": "nice", "image_id": public_id})
+    assert not list(db.collection("images").stream())
+
+    assert move_nested_image_documents() == 1
+    assert move_nested_image_documents() == 0
+
+    image_id = image_doc_id(public_id)
+    assert [doc.id for doc in db.collection("images").stream()] == [image_id]
+    rec = db.collection("images").document(image_id).get().to_dict()
+    assert rec == {"id": image_id, "public_id": public_id, "privacy": "public"}
+    comments = [c.to_dict() for c in db.collection("images").document(image_id).collection("comments").stream()]
+    assert comments == [{"content": "nice", "image_id": image_id}]
+    assert not nested.get().exists
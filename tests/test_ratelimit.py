@@ -0,0 +1,103 @@
+import threading
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.utils import ratelimit
+from app.utils.ratelimit import ConcurrencyGate, RateLimiter, TokenBucket, UploadAdmissionMiddleware
+
+
+def test_token_bucket_burst_then_refill():
+    bucket = TokenBucket(rate_per_sec=2.0, capacity=3)
+    now = bucket.updated
+    assert [bucket.take(now)[0] for _ in range(3)] == [True, True, True]
+    allowed, wait = bucket.take(now)
+    assert not allowed and wait == pytest.approx(0.5)
+    assert bucket.take(now + 0.5) == (True, 0.0)
+    # idle time refills up to capacity, never beyond
+    assert [bucket.take(now + 100)[0] for _ in range(4)] == [True, True, True, False]
+
+
+def test_token_bucket_tolerates_now_before_creation():
+    bucket = TokenBucket(rate_per_sec=1.0, capacity=1)
+    assert bucket.take(bucket.updated - 5) == (True, 0.0)
+
+
+def test_rate_limiter_admits_first_request_of_new_key():
+    limiter = RateLimiter(per_minute=1, burst=1)
+    assert limiter.hit("alice")[0]
+    allowed, wait = limiter.hit("alice")
+    assert not allowed and wait > 0
+    # buckets are per caller
+    assert limiter.hit("bob")[0]
+
+
+def test_rate_limiter_prunes_full_buckets(monkeypatch):
+    limiter = RateLimiter(per_minute=60, burst=1, max_keys=2)
+    clock = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: clock[0])
+    limiter.hit("a")
+    limiter.hit("b")
+    clock[0] += 5
+    assert limiter.hit("c")[0]
+    assert set(limiter._buckets) == {"c"}
+
+
+@pytest.fixture
+def admission(monkeypatch):
+    limiter = RateLimiter(per_minute=60, burst=2)
+    gate = ConcurrencyGate("upload", 1)
+    monkeypatch.setattr(ratelimit, "upload_limiter", limiter)
+    monkeypatch.setattr(ratelimit, "upload_gate", gate)
+    return limiter, gate
+
+
+def _client(handler=None):
+    app = FastAPI()
+
+    @app.post("/upload")
+    def upload():
+        if handler:
+            handler()
+        return {"ok": True}
+
+    @app.get("/upload")
+    def listing():
+        return {"ok": True}
+
+    app.add_middleware(UploadAdmissionMiddleware, paths=[r"/upload"], key_func=lambda scope: "alice")
+    return TestClient(app)
+
+
+def test_middleware_429_with_retry_after(admission):
+    client = _client()
+    assert client.post("/upload").status_code == 200
+    assert client.post("/upload").status_code == 200
+    resp = client.post("/upload")
+    assert resp.status_code == 429
+    assert int(resp.headers["Retry-After"]) >= 1
+    # other methods are not throttled
+    assert client.get("/upload").status_code == 200
+    # admitted requests gave their slot back
+    assert admission[1].active == 0
+
+
+def test_middleware_503_with_retry_after_when_gate_full(admission):
+    _, gate = admission
+    entered, leave = threading.Event(), threading.Event()
+
+    def slow():
+        entered.set()
+        leave.wait(5)
+
+    client = _client(slow)
+    first = threading.Thread(target=client.post, args=("/upload",))
+    first.start()
+    try:
+        assert entered.wait(5)
+        resp = client.post("/upload")
+        assert resp.status_code == 503
+        assert int(resp.headers["Retry-After"]) >= 1
+    finally:
+        leave.set()
+        first.join(5)
+    assert gate.active == 0
@@ -0,0 +1,49 @@
+from fastapi.routing import APIRoute
+from tests.conftest import load_main
+
+
+def _api_routes():
+    return [r for r in load_main().app.routes if isinstance(r, APIRoute)]
+
+
+def test_no_route_is_shadowed():
+    routes = _api_routes()
+    shadowed = []
+    for i, later in enumerate(routes):
+        for earlier in routes[:i]:
+            # Starlette dispatches to the first match, so `later` would never run
+            if earlier.methods & later.methods and earlier.path_regex.match(later.path):
+                shadowed.append(f"{sorted(later.methods)} {later.path} ({later.endpoint.__module__}) "
+                                f"behind {earlier.path} ({earlier.endpoint.__module__})")
+    assert not shadowed, "\n".join(shadowed)
+
+
+def test_router_endpoints_are_mounted():
+    served = {(m, r.path): r.endpoint.__module__ for r in _api_routes() for m in r.methods}
+    assert served[("DELETE", "/api/images/{image_id}")] == "app.routes.images"
+    assert served[("POST", "/api/images/photos/sign")] == "app.routes.images"
+    assert served[("POST", "/api/images/photos/finalize")] == "app.routes.images"
+    assert served[("POST", "/api/uploads/")] == "app.routes.uploads"
+    assert served[("PATCH", "/api/uploads/{upload_id}")] == "app.routes.uploads"
+    assert served[("POST", "/api/search/geo")] == "app.routes.search"
+    assert served[("POST", "/api/search/geo/clusters")] == "app.routes.search"
+    assert served[("GET", "/api/search/similar/{image_id}")] == "app.routes.search"
+
+
+def test_similar_resolves_uploaded_image_ids(db, tmp_path, monkeypatch):
+    import numpy as np
+    from fastapi.testclient import TestClient
+    from app.routes import search
+    from app.routes.images import image_doc_id
+    from app.utils import features
+
+    index = features.FeatureIndex(str(tmp_path / "features.f32"))
+    monkeypatch.setattr(search, "feature_index", index)
+    ids = [image_doc_id(f"sunian-photos/uid/{name}") for name in ("a", "b")]
+    for i, image_id in enumerate(ids):
+        db.collection("images").document(image_id).set({"id": image_id, "privacy": "public"})
+        index.add(image_id, np.full(features.DIM, i + 1, dtype=np.float32))
+
+    res = TestClient(load_main().app).get(f"/api/search/similar/{ids[0]}")
+    assert res.status_code == 200
+    assert [img["id"] for img in res.json()["images"]] == [ids[1]]
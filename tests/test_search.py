@@ -0,0 +1,57 @@
+from datetime import date, datetime, timezone
+from app.routes.search import build_query
+from app.schemas import SearchQuery
+from app.utils.migrations import normalize_image_documents
+
+
+def _ids(query):
+    return [doc.id for doc in query.stream()]
+
+
+def _add(db, image_id, **fields):
+    fields.setdefault("uploaded_at", datetime(2024, 5, 1, 12, tzinfo=timezone.utc))
+    db.collection("images").document(image_id).set(fields)
+
+
+def test_build_query_filters(db):
+    _add(db, "a", album_id="trip", license="CC-BY", camera_model="canon eos r5",
+         uploaded_at=datetime(2024, 5, 2, 9, tzinfo=timezone.utc))
+    _add(db, "b", album_id="trip", license="All Rights Reserved", camera_model="nikon z6",
+         uploaded_at=datetime(2024, 5, 3, 23, 59, tzinfo=timezone.utc))
+    _add(db, "c", album_id="home", license="CC-BY", camera_model="canon eos r5",
+         uploaded_at=datetime(2024, 4, 30, tzinfo=timezone.utc))
+
+    assert _ids(build_query(SearchQuery())) == ["b", "a", "c"]  # newest first
+    assert _ids(build_query(SearchQuery(album_id="trip"))) == ["b", "a"]
+    assert _ids(build_query(SearchQuery(license="CC-BY"))) == ["a", "c"]
+    assert _ids(build_query(SearchQuery(album_id="trip", license="CC-BY"))) == ["a"]
+    # matched the way camera_model was stored
+    assert _ids(build_query(SearchQuery(camera="  Canon  EOS\tR5 "))) == ["a", "c"]
+    assert _ids(build_query(SearchQuery(camera="   "))) == ["b", "a", "c"]
+    # both date bounds are inclusive whole days
+    assert _ids(build_query(SearchQuery(from_date=date(2024, 5, 2), to_date=date(2024, 5, 3)))) == ["b", "a"]
+    assert _ids(build_query(SearchQuery(to_date=date(2024, 5, 1)))) == ["c"]
+
+
+def test_normalize_image_documents(db):
+    db.collection("images").document("old").set({
+        "id": "old",
+        "uploaded_at": "2024-05-01T10:00:00Z",
+        "exif": {"Model": " Canon EOS\x00R5 ", "GPSLatitude": "48.8584", "GPSLongitude": "2.2945"},
+    })
+    done = datetime(2024, 6, 1, tzinfo=timezone.utc)
+    _add(db, "new", id="new", uploaded_at=done, updated_at=done, camera_model=None,
+         privacy="private", exif={}, location=None, geohash=None)
+
+    assert normalize_image_documents() == 1
+    assert normalize_image_documents() == 0
+
+    rec = db.collection("images").document("old").get().to_dict()
+    assert rec["uploaded_at"] == datetime(2024, 5, 1, 10, tzinfo=timezone.utc)
+    assert rec["updated_at"] == rec["uploaded_at"]
+    assert rec["camera_model"] == "canon eos r5"
+    assert rec["privacy"] == "public"
+    assert rec["geohash"]
+    assert db.collection("images").document("new").get().to_dict()["privacy"] == "private"
+    # and the backfilled fields are what search filters on
+    assert _ids(build_query(SearchQuery(camera="CANON EOS R5"))) == ["old"]
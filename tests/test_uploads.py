@@ -0,0 +1,37 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.routes import uploads
+from app.utils.current_user import CurrentUser
+from app.utils.firebase_auth import verify_firebase_token
+from app.utils.staging import StagingFull, UploadStaging
+
+ALICE = CurrentUser(uid="alice", email="alice@example.com", role="visitor")
+
+
+@pytest.fixture
+def client(db, cloudinary_stub):
+    app = FastAPI()
+    app.include_router(uploads.router, prefix="/api/uploads")
+    app.dependency_overrides[verify_firebase_token] = lambda: ALICE
+    return TestClient(app)
+
+
+def test_malformed_content_length_is_400(client):
+    created = client.post("/api/uploads/", json={"filename": "a.jpg", "size": 4})
+    assert created.status_code == 201, created.text
+    upload_id = created.json()["upload_id"]
+    resp = client.patch(
+        f"/api/uploads/{upload_id}",
+        content=b"abcd",
+        headers={"Upload-Offset": "0", "Content-Length": "4x"},
+    )
+    assert resp.status_code == 400
+
+
+def test_staging_quota(tmp_path):
+    staging = UploadStaging(str(tmp_path), ttl_seconds=60, max_bytes=10)
+    staging.create("alice", 6, {})
+    with pytest.raises(StagingFull):
+        staging.create("alice", 6, {})
+    assert len(list(staging._entries())) == 1